@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class CatalogReadRouter(object):
+    """
+    Send reads of the dog catalog to the PUGORUGH_READ_DATABASE alias, a
+    replica or a second connection to the SQLite file, and every write
+    to the primary. Catalog reads made inside a transaction of the
+    primary stay on it so they see the writes of that transaction.
+    """
+    app_label = 'pugorugh'
+    read_models = ('dog', 'catalog')
+
+    def get_read_alias(self):
+        return getattr(settings, 'PUGORUGH_READ_DATABASE', None)
+
+    def db_for_read(self, model, **hints):
+        alias = self.get_read_alias()
+        if (alias and model._meta.app_label == self.app_label and
+                model._meta.model_name in self.read_models and
+                not connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The read alias holds the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == self.get_read_alias():
+            return False
+        return None
@@ -56,6 +56,7 @@ NOSE_ARGS = [
 ]
 
 MIDDLEWARE_CLASSES = [
+    'pugorugh.metrics.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -95,8 +96,18 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Keep each connection open across requests for a minute
+        'CONN_MAX_AGE': 60,
+        # Seconds a query waits for another writer before "database is
+        # locked"
+        'OPTIONS': {'timeout': 20},
     }
 }
+# Catalog reads go through a second connection to the same database (or
+# a replica), see backend/routers.py and PUGORUGH_READ_DATABASE
+DATABASES['read'] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['backend.routers.CatalogReadRouter']
 
 
 # Password validation
@@ -123,7 +134,8 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'pugorugh.authentication.CachedTokenAuthentication',
+        # 'rest_framework.authentication.TokenAuthentication',
         # 'rest_framework.authentication.BasicAuthentication',
         # 'rest_framework.authentication.SessionAuthentication',
     )
@@ -154,3 +166,81 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_DIRS = (
     os.path.join(os.path.dirname(__file__), '../pugorugh/static/'),
 )
+
+
+# Pug or Ugh
+# Only store UserDog rows for liked/disliked dogs, undecided is implied
+PUGORUGH_LAZY_USER_DOGS = False
+
+# Cache alias and timeout (seconds) of the compiled User preferences, a
+# shared cache, see pugorugh.shared. None reads them on every request
+PUGORUGH_PREF_CACHE = None
+PUGORUGH_PREF_CACHE_TIMEOUT = 300
+
+# Token -> user resolutions cached by CachedTokenAuthentication in a
+# per-process LRU ('local'), where revoked tokens still authenticate on
+# the other workers for up to the TTL, or in the shared cache named here.
+# None reads the token on every request
+PUGORUGH_TOKEN_CACHE = 'local'
+PUGORUGH_TOKEN_CACHE_SIZE = 10000
+PUGORUGH_TOKEN_CACHE_TTL = 60
+
+# Cache alias and timeout (seconds) of the catalog version used in ETags
+PUGORUGH_CATALOG_CACHE = 'default'
+PUGORUGH_CATALOG_CACHE_TIMEOUT = 10
+# Cache alias of serialized dogs keyed by (id, catalog version), or None
+PUGORUGH_DOG_CACHE = None
+
+# Per-request query/latency metrics: Server-Timing header, JSON log lines
+# and Prometheus histograms on /api/_metrics/ (admin users only)
+PUGORUGH_METRICS = False
+
+# Serve undecided dogs ranked by the likes/dislikes of the user instead of
+# id order, requires NumPy
+PUGORUGH_RANKING = False
+
+# Walk the undecided deck with an in-memory bitmap index of the catalog,
+# not built for catalogs larger than PUGORUGH_BITSET_MAX_DOGS
+PUGORUGH_BITSET_INDEX = False
+PUGORUGH_BITSET_MAX_DOGS = 2000000
+
+# Who runs the UserDog reconciliation after preferences change: 'inline'
+# in the request, 'thread' in a pool of PUGORUGH_JOB_THREADS threads, or
+# 'database' for a `manage.py run_jobs` worker. Jobs not done after
+# PUGORUGH_JOB_TIMEOUT seconds are requeued.
+PUGORUGH_JOB_RUNNER = 'inline'
+PUGORUGH_JOB_THREADS = 1
+PUGORUGH_JOB_TIMEOUT = 300
+
+# Dog photos, served as static/images/dogs/, and their resized variants
+# built by `manage.py build_image_variants` in its variants/ directory
+PUGORUGH_IMAGE_DIR = os.path.join(BASE_DIR, 'pugorugh', 'static', 'images',
+                                  'dogs')
+
+# Alias of DATABASES receiving the Dog and Catalog reads made outside of
+# a transaction, None to read everything from 'default'
+PUGORUGH_READ_DATABASE = 'read'
+# Run on each new SQLite connection, a negative cache_size is in KiB (20
+# MiB here)
+PUGORUGH_SQLITE_PRAGMAS = (
+    ('cache_size', -20000),
+)
+# Readers and the writer no longer block each other in WAL mode and
+# NORMAL syncs only at checkpoints (safe in WAL mode). WAL mode is stored
+# in the database file, it is only switched on by the server profile
+# (gunicorn.conf.py) so other commands leave the committed db.sqlite3 be
+if os.environ.get('PUGORUGH_SQLITE_WAL') == '1':
+    PUGORUGH_SQLITE_PRAGMAS = (
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+    ) + PUGORUGH_SQLITE_PRAGMAS
+
+# Processes hashing the passwords of /api/user/bulk/, one per CPU if None
+PUGORUGH_HASH_WORKERS = None
+
+# Rows read per query by the streaming exports of /api/export/ and
+# /api/user/export/
+PUGORUGH_EXPORT_CHUNK_SIZE = 2000
+# Seconds the `until` of an incremental export lags behind its start, so
+# rows written by transactions still open are left to the next export
+PUGORUGH_EXPORT_LAG = 5
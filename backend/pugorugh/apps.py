@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class PugorughConfig(AppConfig):
     name = 'pugorugh'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,126 @@
+"""
+Token authentication with a cache of the token -> user resolution
+The resolved tokens are kept for PUGORUGH_TOKEN_CACHE_TTL seconds in a
+bounded LRU of each process by default ('local'). Entries are dropped
+when a token is deleted or its user is saved, see pugorugh.signals, but
+only in the process doing it: the other workers keep authenticating
+the token until its entry expires. PUGORUGH_TOKEN_CACHE can name a
+shared cache instead, see pugorugh.shared, or be None to read the token
+on every request.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from .shared import get_shared_cache
+
+
+CACHE_KEY = 'pugorugh:token:{}'
+# PUGORUGH_TOKEN_CACHE value of the per-process LRU
+LOCAL = 'local'
+
+
+class LRUCache(object):
+    """ Thread safe, size bounded mapping whose entries expire """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_cache = LRUCache(max_size=10000, ttl=60)
+
+
+def get_local_cache():
+    """ The LRU of the process, sized and timed by the current settings """
+    local_cache.max_size = getattr(settings, 'PUGORUGH_TOKEN_CACHE_SIZE',
+                                   10000)
+    local_cache.ttl = getattr(settings, 'PUGORUGH_TOKEN_CACHE_TTL', 60)
+    return local_cache
+
+
+def get_cache_alias():
+    return getattr(settings, 'PUGORUGH_TOKEN_CACHE', LOCAL)
+
+
+def get_shared():
+    alias = get_cache_alias()
+    if alias == LOCAL:
+        return None
+    return get_shared_cache(alias, 'PUGORUGH_TOKEN_CACHE')
+
+
+def get_cached(key):
+    if get_cache_alias() == LOCAL:
+        return get_local_cache().get(key)
+    shared = get_shared()
+    if shared is not None:
+        return shared.get(CACHE_KEY.format(key))
+    return None
+
+
+def set_cached(key, credentials):
+    if get_cache_alias() == LOCAL:
+        get_local_cache().set(key, credentials)
+        return
+    shared = get_shared()
+    if shared is not None:
+        shared.set(CACHE_KEY.format(key), credentials,
+                   getattr(settings, 'PUGORUGH_TOKEN_CACHE_TTL', 60))
+
+
+def invalidate(*keys):
+    """ Forget the resolution of the given token keys """
+    shared = get_shared()
+    for key in keys:
+        if shared is not None:
+            shared.delete(CACHE_KEY.format(key))
+        local_cache.delete(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication only querying the database on a cache miss,
+    every time when no cache is configured
+    """
+
+    def authenticate_credentials(self, key):
+        credentials = get_cached(key)
+        if credentials is None:
+            # Invalid tokens and inactive users raise and are not cached
+            credentials = super(
+                CachedTokenAuthentication, self).authenticate_credentials(key)
+            set_cached(key, credentials)
+        return credentials
@@ -0,0 +1,174 @@
+"""
+Helpers shared by the benchmark management commands
+Synthetic data is always written to a scratch test database so the
+benchmarks never touch the configured one
+"""
+import random
+import time
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test.utils import CaptureQueriesContext
+
+from . import models
+
+
+GENDERS = ('m', 'f', 'u')
+SIZES = ('s', 'm', 'l', 'xl', 'u')
+STATUSES = ('l', 'd', 'u')
+BREEDS = ('Labrador', 'French Bulldog', 'Boxer', 'Swedish Vallhund',
+          'Beagle', 'Poodle', 'Chihuahua', 'Husky', 'Pug', 'Collie')
+
+
+@contextmanager
+def scratch_database(verbosity=0):
+    """
+    Create and migrate a throwaway test database for the block
+    The other aliases (the catalog read alias) mirror it meanwhile, as
+    they do under the test runner, so routed reads see the scratch data
+    """
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(
+        verbosity=verbosity, autoclobber=True, serialize=False)
+    mirrors = {alias: connections[alias].settings_dict['NAME']
+               for alias in connections if alias != DEFAULT_DB_ALIAS}
+    for alias in mirrors:
+        connections[alias].close()
+        connections[alias].creation.set_as_test_mirror(
+            connection.settings_dict)
+    try:
+        yield connection
+    finally:
+        for alias, name in mirrors.items():
+            connections[alias].close()
+            connections[alias].settings_dict['NAME'] = name
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+def create_dogs(count, seed=0, chunk_size=10000):
+    """ Bulk insert count random dogs, chunk_size dogs in memory at most """
+    rand = random.Random(seed)
+    for start in range(0, count, chunk_size):
+        models.Dog.objects.bulk_create(
+            models.Dog(
+                name='Dog {}'.format(number),
+                image_filename='{}.jpg'.format(number),
+                breed=rand.choice(BREEDS),
+                age=rand.randint(1, 99),
+                gender=rand.choice(GENDERS),
+                size=rand.choice(SIZES),
+            ) for number in range(start, min(start + chunk_size, count))
+        )
+    return list(models.Dog.objects.values_list('id', flat=True))
+
+
+def create_users(count, seed=0):
+    """ Bulk insert count users with random preferences """
+    rand = random.Random(seed)
+    User.objects.bulk_create(
+        User(username='bench{}'.format(number), password='!')
+        for number in range(count)
+    )
+    user_ids = list(User.objects.filter(
+        username__startswith='bench').values_list('id', flat=True))
+    models.UserPref.objects.bulk_create(
+        models.UserPref(
+            user_id=user_id,
+            age=','.join(sorted(rand.sample('byas', rand.randint(1, 4)))),
+            gender=','.join(rand.sample('mf', rand.randint(1, 2))),
+            size=','.join(rand.sample(('s', 'm', 'l', 'xl'),
+                                      rand.randint(1, 4))),
+        ) for user_id in user_ids
+    )
+    return user_ids
+
+
+def create_user_dogs(user_ids, dog_ids, per_user, seed=0):
+    """ Bulk insert per_user UserDog rows with random statuses """
+    rand = random.Random(seed)
+    for user_id in user_ids:
+        models.UserDog.objects.bulk_create(
+            models.UserDog(user_id=user_id, dog_id=dog_id,
+                           status=rand.choice(STATUSES))
+            for dog_id in rand.sample(dog_ids, min(per_user, len(dog_ids)))
+        )
+
+
+def timed(func, *args, **kwargs):
+    """ Run func once, return its result and the elapsed seconds """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def percentile(values, rank):
+    """ Nearest-rank percentile of a list of numbers """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, int(round(rank / 100.0 * len(ordered))) - 1)
+    return ordered[index]
+
+
+def execute(queryset):
+    """ Run the SQL of a queryset on the raw cursor, without the ORM """
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def query_plan(queryset):
+    """ SQLite EXPLAIN QUERY PLAN lines of a queryset """
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class Benchmark(object):
+    """
+    Latency and query count samples per operation, summarized the way
+    pytest-benchmark does (min/max/mean/percentiles/operations per second)
+    """
+
+    def __init__(self):
+        self.samples = OrderedDict()
+
+    @contextmanager
+    def measure(self, operation):
+        # Catalog reads go to the read alias, the queries of every
+        # connection are counted (once when aliases share one)
+        with ExitStack() as stack:
+            captures = [
+                stack.enter_context(CaptureQueriesContext(alias_connection))
+                for alias_connection in {
+                    id(alias_connection): alias_connection
+                    for alias_connection in connections.all()}.values()]
+            start = time.perf_counter()
+            yield
+            elapsed = time.perf_counter() - start
+        self.samples.setdefault(operation, []).append(
+            (elapsed, sum(len(queries) for queries in captures)))
+
+    def stats(self):
+        summary = OrderedDict()
+        for operation, samples in self.samples.items():
+            durations = [elapsed for elapsed, _ in samples]
+            queries = [count for _, count in samples]
+            total = sum(durations)
+            summary[operation] = OrderedDict([
+                ('rounds', len(samples)),
+                ('min_ms', min(durations) * 1000),
+                ('max_ms', max(durations) * 1000),
+                ('mean_ms', total / len(samples) * 1000),
+                ('p50_ms', percentile(durations, 50) * 1000),
+                ('p95_ms', percentile(durations, 95) * 1000),
+                ('p99_ms', percentile(durations, 99) * 1000),
+                ('ops_per_sec', len(samples) / total if total else 0.0),
+                ('queries_mean', sum(queries) / float(len(samples))),
+                ('queries_max', max(queries)),
+            ])
+        return summary
@@ -0,0 +1,186 @@
+"""
+In-memory bitmap index of the catalog
+Dogs are numbered by their position in id order and every gender, size
+and age group value has a bitmap (a Python int) of the dogs having it.
+The dogs matching preferences are an AND of ORs of those bitmaps, and
+the user's liked/disliked dogs are removed with one more bitmap, so the
+undecided deck is walked without querying Dog.
+
+The index is rebuilt when the catalog version changes (Dog signals and
+importer runs) and is not built for catalogs larger than
+PUGORUGH_BITSET_MAX_DOGS, the SQL path is used instead. Its size is
+logged on the 'pugorugh.bitsets' logger when it is built and exposed as
+gauges on /api/_metrics/. The decided dogs of a user are cached next to
+the preferences, in PUGORUGH_PREF_CACHE, and invalidated by
+the views changing a status. Enabled by PUGORUGH_BITSET_INDEX.
+"""
+import logging
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+from django.db import transaction
+
+from . import catalog
+from . import metrics
+from . import models
+from . import preferences
+
+
+logger = logging.getLogger('pugorugh.bitsets')
+
+DECIDED_KEY = 'pugorugh:decided:{}'
+
+
+def enabled():
+    return bool(getattr(settings, 'PUGORUGH_BITSET_INDEX', False))
+
+
+def lowest_bit(bitmap):
+    """ Position of the lowest set bit of a non zero bitmap """
+    return (bitmap & -bitmap).bit_length() - 1
+
+
+class DogIndex(object):
+    attributes = ('gender', 'size', 'age')
+
+    def __init__(self, rows):
+        self.ids = array('q')
+        bits = {}
+        for position, (dog_id, gender, size, age) in enumerate(rows):
+            self.ids.append(dog_id)
+            for key in (('gender', gender), ('size', size),
+                        ('age', preferences.age_group(age))):
+                bits.setdefault(key, []).append(position)
+        self.bitmaps = {key: self.to_bitmap(positions)
+                        for key, positions in bits.items()}
+
+    @classmethod
+    def load(cls):
+        return cls(models.Dog.objects.order_by('id').values_list(
+            'id', 'gender', 'size', 'age').iterator())
+
+    def to_bitmap(self, positions):
+        buffer = bytearray((len(self.ids) + 7) // 8)
+        for position in positions:
+            buffer[position >> 3] |= 1 << (position & 7)
+        return int.from_bytes(bytes(buffer), 'little')
+
+    def bitmap_of_ids(self, dog_ids):
+        """ Bitmap of the given dog ids, unknown ids are ignored """
+        positions = []
+        for dog_id in dog_ids:
+            position = bisect_left(self.ids, dog_id)
+            if position < len(self.ids) and self.ids[position] == dog_id:
+                positions.append(position)
+        return self.to_bitmap(positions)
+
+    def matching(self, prefs):
+        """ Bitmap of the dogs matching parsed Preferences """
+        result = -1
+        for attribute, values in (('gender', prefs.genders),
+                                  ('size', prefs.sizes),
+                                  ('age', prefs.ages)):
+            union = 0
+            for value in values:
+                union |= self.bitmaps.get((attribute, value), 0)
+            result &= union
+        return result
+
+    def next_ids(self, bitmap, pk, size):
+        """ Up to size dog ids of bitmap after pk, wrapping around """
+        start = bisect_right(self.ids, pk)
+        dog_ids = []
+        # Dogs after the cursor first, then from the beginning
+        for part, offset in ((bitmap >> start, start),
+                             (bitmap & ((1 << start) - 1), 0)):
+            while part and len(dog_ids) < size:
+                bit = lowest_bit(part)
+                dog_ids.append(self.ids[offset + bit])
+                part >>= bit + 1
+                offset += bit + 1
+        return dog_ids
+
+    def memory_bytes(self):
+        """ Approximate size of the ids array and the bitmaps """
+        return (self.ids.itemsize * len(self.ids) +
+                sum(sys.getsizeof(bitmap) for bitmap in self.bitmaps.values()))
+
+
+class IndexStore(object):
+    """ DogIndex of the current catalog version, shared by threads """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.index = None
+
+    def get(self):
+        """ The index, None when the catalog is too large for it """
+        version, _ = catalog.get_version()
+        with self.lock:
+            if self.version != version:
+                limit = getattr(settings, 'PUGORUGH_BITSET_MAX_DOGS',
+                                2000000)
+                if models.Dog.objects.count() > limit:
+                    self.index = None
+                else:
+                    start = time.perf_counter()
+                    self.index = DogIndex.load()
+                    self.report(time.perf_counter() - start)
+                self.version = version
+            return self.index
+
+    def report(self, seconds):
+        dogs, size = len(self.index.ids), self.index.memory_bytes()
+        metrics.registry.set_gauge('bitset_index_dogs', dogs)
+        metrics.registry.set_gauge('bitset_index_bytes', size)
+        logger.info('Bitmap index of %d dogs built in %.1f ms, %.1f KiB',
+                    dogs, seconds * 1000, size / 1024.0)
+
+
+store = IndexStore()
+
+
+def decided_ids(user):
+    """ Ids of the dogs the user liked or disliked, cached """
+    cache = preferences.get_cache()
+    key = DECIDED_KEY.format(user.id)
+    dog_ids = cache.get(key) if cache is not None else None
+    if dog_ids is None:
+        dog_ids = list(models.UserDog.objects.filter(
+            user=user, status__in=(models.UserDog.LIKED,
+                                   models.UserDog.DISLIKED),
+        ).order_by('dog_id').values_list('dog_id', flat=True))
+        if cache is not None:
+            cache.set(key, dog_ids,
+                      getattr(settings, 'PUGORUGH_PREF_CACHE_TIMEOUT', 300))
+    return dog_ids
+
+
+def invalidate(user):
+    """
+    Forget the decided dogs of a user once the transaction changing a
+    status commits, forgetting them earlier would let a concurrent
+    request cache the old ones again until the timeout
+    """
+    cache = preferences.get_cache()
+    if cache is not None:
+        key = DECIDED_KEY.format(user.id)
+        transaction.on_commit(lambda: cache.delete(key))
+
+
+def undecided_ids(user, pk, size):
+    """
+    Next size undecided dog ids of a user after pk, wrapping around,
+    None when the catalog is too large to be indexed
+    """
+    index = store.get()
+    if index is None:
+        return None
+    undecided = (index.matching(preferences.get_preferences(user)) &
+                 ~index.bitmap_of_ids(decided_ids(user)))
+    return index.next_ids(undecided, pk, size)
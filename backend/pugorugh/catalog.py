@@ -0,0 +1,99 @@
+"""
+Catalog version and conditional dog responses
+Dogs hardly change once imported, so responses made of dogs carry an
+ETag derived from the dog ids and the catalog version, and a matching
+If-None-Match is answered with 304 Not Modified. The version is bumped
+by the importer and by any Dog save/delete (admin edits included).
+Serialized dogs can also be cached by (id, version) in the Django cache
+named by PUGORUGH_DOG_CACHE.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.utils import timezone
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import models
+from .serializers import dog_data
+
+
+VERSION_KEY = 'pugorugh:catalog'
+DOG_KEY = 'pugorugh:dog:{}:{}'
+
+
+def get_version_cache():
+    return caches[getattr(settings, 'PUGORUGH_CATALOG_CACHE', 'default')]
+
+
+def get_version():
+    """ Current (version, modified) of the catalog """
+    cache = get_version_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        catalog, _ = models.Catalog.objects.get_or_create(pk=1)
+        version = (catalog.version, catalog.modified)
+        cache.set(VERSION_KEY, version,
+                  getattr(settings, 'PUGORUGH_CATALOG_CACHE_TIMEOUT', 10))
+    return version
+
+
+def bump_version():
+    """ Invalidate every ETag and cached payload of the catalog """
+    updated = models.Catalog.objects.filter(pk=1).update(
+        version=F('version') + 1, modified=timezone.now())
+    if not updated:
+        models.Catalog.objects.get_or_create(pk=1)
+    get_version_cache().delete(VERSION_KEY)
+
+
+def serialize_dogs(dogs, version):
+    """ Serialized data of the dogs, cached by id and version """
+    alias = getattr(settings, 'PUGORUGH_DOG_CACHE', None)
+    if not alias:
+        return [dog_data(dog) for dog in dogs]
+    cache = caches[alias]
+    keys = [DOG_KEY.format(dog.id, version) for dog in dogs]
+    cached = cache.get_many(keys)
+    missing = {}
+    for key, dog in zip(keys, dogs):
+        if key not in cached:
+            missing[key] = cached[key] = dog_data(dog)
+    if missing:
+        cache.set_many(missing)
+    return [cached[key] for key in keys]
+
+
+def dogs_etag(dogs, version):
+    ids = ','.join(str(dog.id) for dog in dogs)
+    digest = hashlib.md5(ids.encode('ascii')).hexdigest()
+    return quote_etag('{}-{}'.format(digest, version))
+
+
+def not_modified(request, etag):
+    """
+    Only If-None-Match is honoured: a url does not always return the
+    same dogs, so If-Modified-Since alone cannot tell the answer changed
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return etag in tags or '*' in tags
+
+
+def dogs_response(request, dogs, many=True):
+    """ Response of serialized dogs with ETag and Last-Modified """
+    version, modified = get_version()
+    etag = dogs_etag(dogs, version)
+    if not_modified(request, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        data = serialize_dogs(dogs, version)
+        response = Response(data if many else data[0])
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modified.timestamp())
+    # Which dog a url returns depends on the user
+    response['Cache-Control'] = 'private, no-cache'
+    return response
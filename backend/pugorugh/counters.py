@@ -0,0 +1,88 @@
+"""
+Per-user UserDog counters
+UserDeckStats holds how many dogs a user liked, disliked or has left
+undecided so /api/user/stats/ reads one row instead of counting. Code
+writing UserDog rows reports the change of each status with record(),
+applied with F() expressions in the same transaction. A missing row is
+rebuilt from the UserDog rows, as does `manage.py deck_stats --fix` for
+counters that drifted (dogs deleted from the catalog cascade to the
+UserDog rows without updating them).
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from . import models
+
+
+# UserDeckStats field of each status code
+FIELDS = {
+    models.UserDog.LIKED: 'liked',
+    models.UserDog.DISLIKED: 'disliked',
+    models.UserDog.UNDECIDED: 'undecided',
+}
+
+
+def record(user, deltas):
+    """ Add deltas, a dict of status code -> change, to the counters """
+    changes = {FIELDS[status]: F(FIELDS[status]) + delta
+               for status, delta in deltas.items() if delta}
+    if not changes:
+        return
+    if not models.UserDeckStats.objects.filter(user=user).update(**changes):
+        recount(user)
+
+
+def count_rows(user):
+    """ Counters computed from the UserDog rows of the user """
+    counts = dict.fromkeys(FIELDS.values(), 0)
+    rows = models.UserDog.objects.filter(user=user).values_list(
+        'status').annotate(count=Count('id')).order_by()
+    for status, count in rows:
+        counts[FIELDS[status]] = count
+    return counts
+
+
+def recount(user):
+    """ Rebuild the counters of the user from their UserDog rows """
+    counts = count_rows(user)
+    try:
+        with transaction.atomic():
+            return models.UserDeckStats.objects.create(user=user, **counts)
+    except IntegrityError:
+        # Already there, or created by a concurrent request
+        models.UserDeckStats.objects.filter(user=user).update(**counts)
+        return models.UserDeckStats.objects.get(user=user)
+
+
+def get_stats(user):
+    """ The counters of the user, built on first use """
+    try:
+        return models.UserDeckStats.objects.get(user=user)
+    except models.UserDeckStats.DoesNotExist:
+        return recount(user)
+
+
+def verify():
+    """
+    Compare every stored counter to the UserDog rows with two grouped
+    queries, returns {user id: (stored, actual)} for the ones that differ
+    stored is None for users with UserDog rows but no counters yet
+    """
+    actual = {}
+    rows = models.UserDog.objects.values_list('user_id', 'status').annotate(
+        count=Count('id')).order_by()
+    for user_id, status, count in rows:
+        actual.setdefault(user_id, dict.fromkeys(FIELDS.values(), 0))[
+            FIELDS[status]] = count
+    stored = {
+        user_id: dict(zip(('liked', 'disliked', 'undecided'), values))
+        for user_id, *values in models.UserDeckStats.objects.values_list(
+            'user_id', 'liked', 'disliked', 'undecided')
+    }
+    empty = dict.fromkeys(FIELDS.values(), 0)
+    mismatches = {}
+    for user_id in set(actual).union(stored):
+        counts = actual.get(user_id, empty)
+        if stored.get(user_id) != counts:
+            mismatches[user_id] = (stored.get(user_id), counts)
+    return mismatches
@@ -0,0 +1,26 @@
+"""
+Keyset navigation through a queryset of dogs
+Dogs are always walked in id order starting after a given id, and the
+walk wraps around to the first dogs once the end is reached. Both parts
+are fetched by the same query: each one is a LIMIT subquery and the
+dogs after the cursor are ordered before the wrapped ones.
+"""
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from . import models
+
+
+def next_dogs(dogs_query, pk, size):
+    """ Up to size dogs after pk, wrapping around, in a single query """
+    after = dogs_query.filter(id__gt=pk).order_by('id').values('id')[:size]
+    first = dogs_query.order_by('id').values('id')[:size]
+    wrapped = Case(When(id__gt=pk, then=Value(0)), default=Value(1),
+                   output_field=IntegerField())
+    return list(models.Dog.objects.filter(
+        Q(id__in=after) | Q(id__in=first)).order_by(wrapped, 'id')[:size])
+
+
+def next_dog(dogs_query, pk):
+    """ The dog after pk, the first one after the last, None if empty """
+    dogs = next_dogs(dogs_query, pk, 1)
+    return dogs[0] if dogs else None
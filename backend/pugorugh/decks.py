@@ -0,0 +1,50 @@
+"""
+UserDog rows of the deck of each user
+Outside of lazy mode every dog matching the preferences of a user has a
+row, 'undecided' until swiped. Saving preferences reconciles the rows
+with reconcile_user_dogs(), run by a job (see pugorugh.jobs).
+"""
+from django.db import transaction
+
+from . import counters
+from . import models
+from . import preferences
+
+
+# Rows per INSERT and values per IN (...) lookup, stays below the 999
+# bound parameters allowed by SQLite
+BATCH_SIZE = 500
+
+
+def preferred_dogs(user_pref):
+    """ Dogs matching the given User preferences """
+    return models.Dog.objects.filter(preferences.compile_filter(user_pref))
+
+
+def reconcile_user_dogs(user, user_pref):
+    """
+    Synchronize the UserDog rows of a user with their preferences.
+    Only the difference is written: matching dogs without a row are
+    inserted as 'undecided', undecided rows of dogs that no longer match
+    are deleted and liked/disliked rows are never touched. The undecided
+    counter of the user follows.
+    """
+    with transaction.atomic():
+        # Writing first takes the SQLite write lock up front, a transaction
+        # that read first can not write once another writer committed
+        deleted, _ = models.UserDog.objects.filter(
+            user=user, status=models.UserDog.UNDECIDED,
+        ).exclude(dog__in=preferred_dogs(user_pref)).delete()
+        matching = set(
+            preferred_dogs(user_pref).values_list('id', flat=True))
+        current = set(models.UserDog.objects.filter(
+            user=user).values_list('dog_id', flat=True))
+        to_create = sorted(matching.difference(current))
+        models.UserDog.objects.bulk_create(
+            [models.UserDog(user=user, dog_id=dog_id)
+             for dog_id in to_create],
+            batch_size=BATCH_SIZE,
+        )
+        counters.record(
+            user, {models.UserDog.UNDECIDED: len(to_create) - deleted})
+    return len(to_create), deleted
@@ -0,0 +1,126 @@
+"""
+Streaming exports of the dog catalog and of the UserDog decisions
+Rows are read with values_list() in batches of CHUNK_SIZE ids, each
+batch starting after the last id of the previous one, and encoded as
+NDJSON or CSV one batch at a time. SQLite connections can not fetch a
+result in chunks (QuerySet.iterator() loads it whole), walking the ids
+keeps the memory used by an export the same whatever its size.
+
+Decisions can be exported incrementally: an export only holds the rows
+modified before its `until` and passing it as the `since` of the next
+export picks up where it ended. `modified` is set when a row is written,
+not when its transaction commits, so `until` lags PUGORUGH_EXPORT_LAG
+seconds behind the start of the export: a row written just before the
+export but committed after it read the table falls in the next export.
+Transactions running longer than the lag can still be missed.
+"""
+import csv
+import io
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import models
+from .serializers import DOG_FIELDS
+
+
+CHUNK_SIZE = 2000
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+DOG_COLUMNS = DOG_FIELDS
+DECISION_COLUMNS = ('user_id', 'dog_id', 'status', 'modified')
+# API name of each status code
+STATUS_NAMES = {code: name for name, code in models.UserDog.STATUSES.items()}
+
+
+def parse_since(value):
+    """ Aware datetime of an ISO 8601 string, ValueError when invalid """
+    since = parse_datetime(value.strip())
+    if since is None:
+        raise ValueError('Expected an ISO 8601 date and time.')
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def export_until():
+    """ Upper bound of the decisions an export started now holds """
+    return timezone.now() - timedelta(
+        seconds=getattr(settings, 'PUGORUGH_EXPORT_LAG', 5))
+
+
+def iter_batches(queryset, fields, chunk_size=CHUNK_SIZE):
+    """ values_list() rows of the queryset in id order, a list per query """
+    last = None
+    while True:
+        batch = queryset if last is None else queryset.filter(id__gt=last)
+        rows = list(batch.order_by('id').values_list(
+            'id', *fields)[:chunk_size])
+        if rows:
+            yield [row[1:] for row in rows]
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1][0]
+
+
+def dog_batches(chunk_size=CHUNK_SIZE):
+    return iter_batches(models.Dog.objects.all(), DOG_COLUMNS, chunk_size)
+
+
+def decisions(user=None, status=None, since=None, until=None):
+    """ UserDog rows of a user, or of everyone, modified in [since, until) """
+    user_dogs = models.UserDog.objects.all()
+    if user is not None:
+        user_dogs = user_dogs.filter(user=user)
+    if status is not None:
+        user_dogs = user_dogs.filter(status=status)
+    if since is not None:
+        user_dogs = user_dogs.filter(modified__gte=since)
+    if until is not None:
+        user_dogs = user_dogs.filter(modified__lt=until)
+    return user_dogs
+
+
+def decision_batches(user_dogs, chunk_size=CHUNK_SIZE):
+    for rows in iter_batches(user_dogs, DECISION_COLUMNS, chunk_size):
+        yield [(user_id, dog_id, STATUS_NAMES[status], modified)
+               for user_id, dog_id, status, modified in rows]
+
+
+def encode_ndjson(batches, columns):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for rows in batches:
+        yield ''.join(encoder.encode(dict(zip(columns, row))) + '\n'
+                      for row in rows)
+
+
+def encode_csv(batches, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(
+            [value.isoformat() if hasattr(value, 'isoformat') else value
+             for value in row] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, for an empty export
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+ENCODERS = {
+    'ndjson': encode_ndjson,
+    'csv': encode_csv,
+}
+
+
+def encode(batches, columns, fmt):
+    """ Text chunks of the rows in the given format, one per batch """
+    return ENCODERS[fmt](batches, columns)
@@ -0,0 +1,207 @@
+"""
+Responsive variants of the dog photos
+`manage.py build_image_variants` resizes every photo of the dogs
+directory (static/images/dogs, PUGORUGH_IMAGE_DIR) to a few widths, as
+JPEG and, when Pillow was built with it, WebP. Variants are written to
+its variants/ directory under content-hashed names, so they can be
+cached forever, and listed in variants/manifest.json along with the
+hash of each photo: photos that did not change are skipped by the next
+build. dog_data() and DogSerializer expose the urls of the variants of
+each dog, {} for a dog without any.
+
+Building requires Pillow, reading the manifest does not.
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # pragma: no cover
+    Image = None
+
+
+WIDTHS = (320, 640, 1080)
+FORMATS = ('webp', 'jpeg')
+QUALITY = 80
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp'}
+# Where the variants are served from, below STATIC_URL
+STATIC_PATH = 'images/dogs/variants/'
+MANIFEST = 'manifest.json'
+# Seconds between two checks of the manifest for a new build
+RELOAD_INTERVAL = 5
+
+
+def get_source_dir():
+    return getattr(settings, 'PUGORUGH_IMAGE_DIR', os.path.join(
+        os.path.dirname(__file__), 'static', 'images', 'dogs'))
+
+
+def get_variant_dir():
+    return os.path.join(get_source_dir(), 'variants')
+
+
+def available_formats(formats):
+    """ The formats Pillow can write here, WebP needs libwebp """
+    return tuple(fmt for fmt in formats
+                 if fmt != 'webp' or features.check('webp'))
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def options_hash(widths, formats, quality):
+    """ Changing any build option invalidates every variant """
+    return hashlib.sha256(json.dumps(
+        [list(widths), list(formats), quality]).encode()).hexdigest()[:12]
+
+
+def build_photo(task):
+    """
+    Write the variants of one photo, run in a pool process. Returns
+    {format: {width: file name}}
+    """
+    path, output_dir, widths, formats, quality = task
+    stem = os.path.splitext(os.path.basename(path))[0]
+    variants = {fmt: {} for fmt in formats}
+    with Image.open(path) as image:
+        # Lets the JPEG decoder downscale while decoding, much faster
+        # than decoding the full size photo to shrink it afterwards
+        image.draft('RGB', (max(widths), max(widths)))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for width in widths:
+            target = min(width, image.width)
+            resized = image.resize(
+                (target, max(1, round(image.height * target / image.width))),
+                Image.LANCZOS)
+            for fmt in formats:
+                data = io.BytesIO()
+                resized.save(data, fmt.upper(), quality=quality,
+                             optimize=True)
+                content = data.getvalue()
+                name = '{}-{}w.{}.{}'.format(
+                    stem, width, hashlib.sha256(content).hexdigest()[:12],
+                    EXTENSIONS[fmt])
+                target_path = os.path.join(output_dir, name)
+                if not os.path.exists(target_path):
+                    with open(target_path, 'wb') as output:
+                        output.write(content)
+                variants[fmt][str(width)] = name
+    return variants
+
+
+def load_manifest(variant_dir=None):
+    path = os.path.join(variant_dir or get_variant_dir(), MANIFEST)
+    try:
+        with open(path) as manifest:
+            return json.load(manifest)
+    except (IOError, ValueError):
+        return {'options': None, 'photos': {}}
+
+
+def write_manifest(manifest, variant_dir):
+    """ Replace the manifest at once, readers never see half of it """
+    path = os.path.join(variant_dir, MANIFEST)
+    with open(path + '.tmp', 'w') as output:
+        json.dump(manifest, output, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def build(widths=WIDTHS, formats=FORMATS, quality=QUALITY, workers=None,
+          force=False):
+    """
+    Build the variants of the new and changed photos with a process pool
+    Returns the number of photos built, skipped and variant files removed
+    """
+    source_dir, variant_dir = get_source_dir(), get_variant_dir()
+    os.makedirs(variant_dir, exist_ok=True)
+    formats = available_formats(formats)
+    options = options_hash(widths, formats, quality)
+    manifest = load_manifest(variant_dir)
+    if manifest['options'] != options:
+        force = True
+    photos = {}
+    tasks = []
+    for filename in sorted(os.listdir(source_dir)):
+        path = os.path.join(source_dir, filename)
+        if (not os.path.isfile(path) or
+                not filename.lower().endswith(SOURCE_EXTENSIONS)):
+            continue
+        digest = file_hash(path)
+        previous = manifest['photos'].get(filename)
+        if (not force and previous and previous['hash'] == digest and all(
+                os.path.exists(os.path.join(variant_dir, name))
+                for names in previous['variants'].values()
+                for name in names.values())):
+            photos[filename] = previous
+            continue
+        photos[filename] = {'hash': digest}
+        tasks.append((path, variant_dir, widths, formats, quality))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for (path, *_), variants in zip(tasks, pool.map(build_photo, tasks)):
+            photos[os.path.basename(path)]['variants'] = variants
+
+    write_manifest({'options': options, 'photos': photos}, variant_dir)
+    used = {name for photo in photos.values()
+            for names in photo['variants'].values()
+            for name in names.values()}
+    removed = 0
+    for filename in os.listdir(variant_dir):
+        if filename != MANIFEST and filename not in used:
+            os.remove(os.path.join(variant_dir, filename))
+            removed += 1
+    return len(tasks), len(photos) - len(tasks), removed
+
+
+class VariantUrls(object):
+    """ Variant urls by image filename, reloaded after a new build """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked = None
+        self.stamp = None
+        self.urls = {}
+
+    def get(self, image_filename):
+        now = time.monotonic()
+        if self.checked is None or now - self.checked > RELOAD_INTERVAL:
+            self.reload(now)
+        return self.urls.get(image_filename, {})
+
+    def reload(self, now=None):
+        path = os.path.join(get_variant_dir(), MANIFEST)
+        try:
+            stamp = (path, os.stat(path).st_mtime)
+        except OSError:
+            stamp = (path, None)
+        with self.lock:
+            self.checked = time.monotonic() if now is None else now
+            if stamp == self.stamp:
+                return
+            photos = load_manifest()['photos'] if stamp[1] else {}
+            self.urls = {
+                filename: {
+                    fmt: {width: staticfiles_storage.url(STATIC_PATH + name)
+                          for width, name in sorted(
+                              names.items(), key=lambda item: int(item[0]))}
+                    for fmt, names in sorted(photo['variants'].items())
+                } for filename, photo in photos.items()
+            }
+            self.stamp = stamp
+
+
+variant_urls = VariantUrls()
@@ -0,0 +1,353 @@
+"""
+Streaming Dog and User importers
+Records are decoded one at a time from a JSON array or a JSON lines file,
+validated with a serializer and written chunk by chunk, each chunk in
+its own transaction. Lines that are not valid JSON are rejected like
+invalid records. Dogs are matched on image_filename so importing the
+same feed twice does not duplicate them. Users are only created, with
+their passwords hashed by a process pool, default preferences and a
+token. Their UserDog rows are inserted along with them, or left to
+reconcile jobs when a background job runner is configured.
+"""
+import itertools
+import json
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+
+from . import catalog
+from . import jobs
+from . import models
+from . import preferences
+from .decks import BATCH_SIZE
+from .serializers import DogSerializer, UserImportSerializer
+
+
+BUFFER_SIZE = 64 * 1024
+# Longest JSON array record read while looking for its end
+MAX_RECORD_SIZE = 1024 * 1024
+
+
+class MalformedRecord(object):
+    """ A line of a JSON lines file that is not valid JSON """
+
+    def __init__(self, line, text, error):
+        self.line = line
+        self.text = text
+        self.error = error
+
+
+def iter_records(fp, buffer_size=BUFFER_SIZE):
+    """
+    Yield the values of a JSON array or JSON lines file one by one. The
+    lines that are not valid JSON are yielded as MalformedRecord, a
+    malformed array raises ValueError as its next record can not be found
+    """
+    head = ''
+    char = ' '
+    while char.isspace():
+        char = fp.read(1)
+        head += char
+    if char == '[':
+        yield from iter_array(fp, buffer_size)
+        return
+    lines = itertools.chain((head + fp.readline()).splitlines(True), fp)
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as error:
+            yield MalformedRecord(number, line.rstrip('\r\n'), str(error))
+
+
+def iter_array(fp, buffer_size=BUFFER_SIZE):
+    """ Yield the values of a JSON array, read after its opening bracket """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    while True:
+        # Skip separators and whitespace between two records
+        while position < len(buffer) and (
+                buffer[position].isspace() or buffer[position] == ','):
+            position += 1
+        if position < len(buffer):
+            if buffer[position] == ']':
+                return
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+            except ValueError as error:
+                # A record not complete yet is read further, up to a bound
+                if eof or len(buffer) - position > MAX_RECORD_SIZE:
+                    raise ValueError(
+                        'Malformed record in the JSON array: {}'.format(
+                            error))
+            else:
+                yield record
+                position = end
+                continue
+        elif eof:
+            return
+        chunk = fp.read(buffer_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def write_reject(errors, number, detail, record):
+    """ Write a rejected record as a JSON line to the errors file object """
+    if errors is None:
+        return
+    report = {'record': number, 'errors': detail, 'data': record}
+    if isinstance(record, MalformedRecord):
+        report.update(line=record.line, data=record.text)
+    errors.write(json.dumps(report) + '\n')
+
+
+def chunks(iterable, size):
+    """ Group an iterable into lists of at most size items """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class DogImporter(object):
+    """
+    Import dogs from a file object, rejected records are written as JSON
+    lines to the errors file object if one is given
+    """
+    fields = ('name', 'image_filename', 'breed', 'age', 'gender', 'size')
+
+    def __init__(self, chunk_size=BATCH_SIZE, errors=None):
+        self.chunk_size = chunk_size
+        self.errors = errors
+        self.serializer = DogSerializer()
+        self.stats = dict(read=0, created=0, updated=0, unchanged=0,
+                          rejected=0, seconds=0.0, peak_rss_kb=0)
+
+    def run(self, fp):
+        start = time.perf_counter()
+        for chunk in chunks(iter_records(fp), self.chunk_size):
+            self.import_chunk(chunk)
+        # bulk_create and update() do not send the Dog signals
+        if self.stats['created'] or self.stats['updated']:
+            catalog.bump_version()
+        self.stats['seconds'] = time.perf_counter() - start
+        self.stats['peak_rss_kb'] = resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss
+        return self.stats
+
+    def reject(self, number, detail, record):
+        self.stats['rejected'] += 1
+        write_reject(self.errors, number, detail, record)
+
+    def validate(self, record):
+        """ Validated data of a record, None when it is rejected """
+        number = self.stats['read']
+        self.stats['read'] += 1
+        if isinstance(record, MalformedRecord):
+            self.reject(number, {'json': [record.error]}, record)
+            return None
+        try:
+            return self.serializer.run_validation(record)
+        except ValidationError as error:
+            self.reject(number, error.detail, record)
+
+    def import_chunk(self, records):
+        # The last record wins when a file name is repeated
+        dogs = {}
+        for record in records:
+            data = self.validate(record)
+            if data is not None:
+                dogs[data['image_filename']] = data
+        if not dogs:
+            return
+        with transaction.atomic():
+            existing = {}
+            for batch in chunks(dogs, BATCH_SIZE):
+                existing.update(
+                    (row['image_filename'], row)
+                    for row in models.Dog.objects.filter(
+                        image_filename__in=batch).values('id', *self.fields))
+            new = []
+            for image_filename, data in dogs.items():
+                current = existing.get(image_filename)
+                if current is None:
+                    new.append(models.Dog(**data))
+                elif all(current[field] == data.get(field, current[field])
+                         for field in self.fields):
+                    self.stats['unchanged'] += 1
+                else:
+                    models.Dog.objects.filter(
+                        id=current['id']).update(**data)
+                    self.stats['updated'] += 1
+            models.Dog.objects.bulk_create(new)
+            self.stats['created'] += len(new)
+
+    def summary(self):
+        seconds = self.stats['seconds'] or 1e-9
+        return ('{read} read, {created} created, {updated} updated, '
+                '{unchanged} unchanged, {rejected} rejected in '
+                '{seconds:.2f}s ({rate:.0f} rows/s), peak RSS '
+                '{peak_mb:.1f} MB').format(
+                    rate=self.stats['read'] / seconds,
+                    peak_mb=self.stats['peak_rss_kb'] / 1024.0,
+                    **self.stats)
+
+
+class UserImporter(object):
+    """
+    Create users from a file object or an iterable of records, with
+    their UserPref and Token. Rejected records are written as JSON lines
+    to the errors file object and the created users with their token to
+    the tokens file object, when they are given. PBKDF2 is slow by
+    design so passwords are hashed by workers processes (one per CPU by
+    default, none with workers=1).
+    """
+
+    def __init__(self, chunk_size=BATCH_SIZE, errors=None, tokens=None,
+                 workers=None):
+        self.chunk_size = chunk_size
+        self.errors = errors
+        self.tokens = tokens
+        self.workers = workers
+        self.serializer = UserImportSerializer()
+        self.stats = dict(read=0, created=0, rejected=0, seconds=0.0,
+                          peak_rss_kb=0)
+
+    def run(self, fp):
+        return self.import_records(iter_records(fp))
+
+    def import_records(self, records):
+        start = time.perf_counter()
+        pool = None
+        if self.workers != 1:
+            pool = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            for chunk in chunks(records, self.chunk_size):
+                self.import_chunk(chunk, pool)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        self.stats['seconds'] = time.perf_counter() - start
+        self.stats['peak_rss_kb'] = resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss
+        return self.stats
+
+    def reject(self, number, detail, record):
+        self.stats['rejected'] += 1
+        write_reject(self.errors, number, detail, record)
+
+    def validate(self, record):
+        """ Validated data of a record, None when it is rejected """
+        number = self.stats['read']
+        self.stats['read'] += 1
+        if isinstance(record, MalformedRecord):
+            self.reject(number, {'json': [record.error]}, record)
+            return number, None
+        try:
+            return number, self.serializer.run_validation(record)
+        except ValidationError as error:
+            self.reject(number, error.detail, record)
+            return number, None
+
+    def hash_passwords(self, passwords, pool):
+        if pool is None:
+            return [make_password(password) for password in passwords]
+        return list(pool.map(make_password, passwords,
+                             chunksize=max(1, len(passwords) // 64)))
+
+    def import_chunk(self, records, pool):
+        User = get_user_model()
+        users = {}
+        for record in records:
+            number, data = self.validate(record)
+            if data is None:
+                continue
+            if data['username'] in users:
+                self.reject(number, {'username': [
+                    'Listed more than once.']}, record)
+                continue
+            users[data['username']] = (number, data, record)
+        existing = set()
+        for batch in chunks(users, BATCH_SIZE):
+            existing.update(User.objects.filter(
+                username__in=batch).values_list('username', flat=True))
+        for username in sorted(existing):
+            number, _, record = users.pop(username)
+            self.reject(number, {'username': [
+                'A user with that username already exists.']}, record)
+        if not users:
+            return
+        usernames = list(users)
+        passwords = self.hash_passwords(
+            [users[username][1]['password'] for username in usernames], pool)
+        with transaction.atomic():
+            User.objects.bulk_create(
+                User(username=username, password=password,
+                     email=users[username][1].get('email', ''))
+                for username, password in zip(usernames, passwords))
+            # bulk_create does not set the ids on SQLite
+            user_ids = {}
+            for batch in chunks(usernames, BATCH_SIZE):
+                user_ids.update(User.objects.filter(
+                    username__in=batch).values_list('username', 'id'))
+            models.UserPref.objects.bulk_create(
+                models.UserPref(user_id=user_ids[username])
+                for username in usernames)
+            tokens = {username: Token().generate_key()
+                      for username in usernames}
+            Token.objects.bulk_create(
+                Token(key=tokens[username], user_id=user_ids[username])
+                for username in usernames)
+            # Default preferences still need their UserDog rows, built
+            # here at once by the inline runner instead of one job per user
+            eager = not getattr(settings, 'PUGORUGH_LAZY_USER_DOGS', False)
+            if eager and jobs.get_runner() == 'inline':
+                self.create_user_dogs(user_ids.values())
+        self.stats['created'] += len(usernames)
+        if eager and jobs.get_runner() != 'inline':
+            for username in usernames:
+                jobs.enqueue(User(id=user_ids[username], username=username))
+        if self.tokens is not None:
+            for username in usernames:
+                self.tokens.write(json.dumps(
+                    {'username': username, 'id': user_ids[username],
+                     'token': tokens[username]}) + '\n')
+
+    def create_user_dogs(self, user_ids):
+        """
+        Undecided UserDog rows and counters of new users, who all have the
+        default preferences: the matching dogs are read once per chunk
+        """
+        dog_ids = list(models.Dog.objects.filter(preferences.compile_filter(
+            models.UserPref())).values_list('id', flat=True))
+        for user_id in user_ids:
+            models.UserDog.objects.bulk_create(
+                [models.UserDog(user_id=user_id, dog_id=dog_id)
+                 for dog_id in dog_ids], batch_size=BATCH_SIZE)
+        models.UserDeckStats.objects.bulk_create(
+            [models.UserDeckStats(user_id=user_id, undecided=len(dog_ids))
+             for user_id in user_ids], batch_size=BATCH_SIZE)
+
+    def summary(self):
+        seconds = self.stats['seconds'] or 1e-9
+        return ('{read} read, {created} created, {rejected} rejected in '
+                '{seconds:.2f}s ({rate:.0f} rows/s), peak RSS '
+                '{peak_mb:.1f} MB').format(
+                    rate=self.stats['read'] / seconds,
+                    peak_mb=self.stats['peak_rss_kb'] / 1024.0,
+                    **self.stats)
@@ -0,0 +1,171 @@
+"""
+Background reconciliation of the UserDog rows
+Saving preferences records a ReconcileJob instead of rebuilding the
+UserDog rows of the user inside the request. PUGORUGH_JOB_RUNNER picks
+who runs it:
+
+* 'inline': right away in the request, the behavior of a plain deploy
+* 'thread': a thread pool of the web process once the request committed
+* 'database': the job stays pending in the database until a
+  `manage.py run_jobs` worker picks it up
+
+While a job of a user is pending or running the views filter their
+undecided dogs on the fly (as in lazy mode) so the deck is right before
+the rows are. That state is read from the ReconcileJob rows, which every
+web worker and the run_jobs process share.
+
+Gunicorn restarts its workers every max_requests, losing the jobs they
+were running and the 'thread' jobs they had queued. A job running for
+more than PUGORUGH_JOB_TIMEOUT seconds, or a 'thread' job pending that
+long, is put back to pending (and submitted again by the 'thread'
+runner) when the views look for the jobs of its user and before the
+run_jobs worker picks jobs. Reconciling a user twice is harmless.
+"""
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import models
+from .decks import reconcile_user_dogs
+
+
+logger = logging.getLogger('pugorugh.jobs')
+
+# Times a job is tried when a concurrent swipe inserted a row first or
+# SQLite was locked by another writer
+ATTEMPTS = 3
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_runner():
+    return getattr(settings, 'PUGORUGH_JOB_RUNNER', 'inline')
+
+
+def get_executor():
+    """ Thread pool of the 'thread' runner, created on first use """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'PUGORUGH_JOB_THREADS', 1))
+        return _executor
+
+
+def enqueue(user):
+    """ Record a reconciliation job of the user and hand it to the runner """
+    job = models.ReconcileJob.objects.create(user=user)
+    runner = get_runner()
+    if runner == 'inline':
+        run(job.id)
+        job.refresh_from_db()
+        return job
+    if runner == 'thread':
+        transaction.on_commit(
+            lambda: get_executor().submit(run_in_thread, job.id))
+    return job
+
+
+def pending(user):
+    """
+    Whether the UserDog rows of the user may be out of date, never with
+    the inline runner whose jobs are done when the request ends
+    """
+    if get_runner() == 'inline':
+        return False
+    active = models.ReconcileJob.objects.filter(
+        user=user.id, status__in=(models.ReconcileJob.PENDING,
+                                  models.ReconcileJob.RUNNING))
+    if not active.exists():
+        return False
+    requeue_stale(active)
+    return True
+
+
+def requeue_stale(jobs):
+    """
+    Hand the jobs of the queryset that outlived PUGORUGH_JOB_TIMEOUT to
+    the runner again, returns how many there were
+    """
+    runner = get_runner()
+    deadline = timezone.now() - timedelta(
+        seconds=getattr(settings, 'PUGORUGH_JOB_TIMEOUT', 300))
+    stale = Q(status=models.ReconcileJob.RUNNING, started__lt=deadline)
+    if runner == 'thread':
+        # Lost with its worker before a thread started it
+        stale |= Q(status=models.ReconcileJob.PENDING, created__lt=deadline)
+    job_ids = list(jobs.filter(stale).values_list('id', flat=True))
+    if not job_ids:
+        return 0
+    logger.warning('Requeuing stale reconcile jobs %s', job_ids)
+    models.ReconcileJob.objects.filter(
+        id__in=job_ids, status=models.ReconcileJob.RUNNING,
+    ).update(status=models.ReconcileJob.PENDING, started=None)
+    if runner == 'thread':
+        for job_id in job_ids:
+            transaction.on_commit(
+                lambda job_id=job_id: get_executor().submit(
+                    run_in_thread, job_id))
+    return len(job_ids)
+
+
+def claim(job_id):
+    """ Mark a pending job as running, False when already taken """
+    return models.ReconcileJob.objects.filter(
+        id=job_id, status=models.ReconcileJob.PENDING,
+    ).update(status=models.ReconcileJob.RUNNING,
+             started=timezone.now()) > 0
+
+
+def run(job_id):
+    """ Run a pending job, returns False when it was not pending """
+    if not claim(job_id):
+        return False
+    job = models.ReconcileJob.objects.select_related('user').get(id=job_id)
+    try:
+        for attempt in range(1, ATTEMPTS + 1):
+            try:
+                user_pref = models.UserPref.objects.get(user=job.user)
+                job.created_dogs, job.deleted_dogs = reconcile_user_dogs(
+                    job.user, user_pref)
+                break
+            except DatabaseError:
+                if attempt == ATTEMPTS:
+                    raise
+                time.sleep(0.1 * attempt)
+        job.status = models.ReconcileJob.DONE
+    except Exception:
+        logger.exception('Reconcile job %s failed', job_id)
+        job.status = models.ReconcileJob.FAILED
+        job.error = traceback.format_exc()
+    job.finished = timezone.now()
+    job.save()
+    return True
+
+
+def run_in_thread(job_id):
+    """ run() from a pool thread, which owns its database connection """
+    try:
+        run(job_id)
+    finally:
+        connection.close()
+
+
+def run_pending(limit=None):
+    """ Run the pending jobs oldest first, returns how many ran """
+    requeue_stale(models.ReconcileJob.objects.all())
+    job_ids = models.ReconcileJob.objects.filter(
+        status=models.ReconcileJob.PENDING,
+    ).order_by('id').values_list('id', flat=True)
+    if limit is not None:
+        job_ids = job_ids[:limit]
+    return sum(1 for job_id in list(job_ids) if run(job_id))
@@ -0,0 +1,154 @@
+import json
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand
+
+from pugorugh import bench
+
+
+class Command(BaseCommand):
+    help = ('Swipe against a running server with an increasing number of '
+            'concurrent clients, optionally alongside clients browsing '
+            'decks, and report throughput, latency and "database is '
+            'locked" errors, to compare worker profiles and database '
+            'settings')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000',
+                            help='Root url of the server under test')
+        parser.add_argument('--concurrency', type=int, nargs='+',
+                            default=[1, 4, 16, 64])
+        parser.add_argument('--swipes', type=int, default=20,
+                            help='Swipes per client')
+        parser.add_argument('--readers', type=int, default=0,
+                            help='Clients browsing decks and liked dogs '
+                                 'per swiping client')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Save the results as JSON')
+
+    def handle(self, *args, **options):
+        self.url = options['url'].rstrip('/')
+        self.rand = random.Random(options['seed'])
+        self.lock = threading.Lock()
+        results = {}
+        self.stdout.write(
+            '{:>12}{:>12}{:>10}{:>10}{:>12}{:>12}{:>12}'.format(
+                'clients', 'requests', 'errors', 'locked', 'req_per_sec',
+                'p50_ms', 'p95_ms'))
+        for clients in options['concurrency']:
+            readers = clients * options['readers']
+            tokens = [self.login() for _ in range(clients)]
+            tokens += [self.login(preferences=True) for _ in range(readers)]
+            jobs = [(self.swipe, token) for token in tokens[:clients]]
+            jobs += [(self.browse, token) for token in tokens[clients:]]
+            self.durations, self.errors, self.locked = [], 0, 0
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+                list(executor.map(
+                    lambda job: job[0](job[1], options['swipes']), jobs))
+            elapsed = time.perf_counter() - start
+            stats = {
+                'requests': len(self.durations),
+                'errors': self.errors,
+                'locked': self.locked,
+                'req_per_sec': len(self.durations) / elapsed,
+                'p50_ms': bench.percentile(self.durations, 50) * 1000,
+                'p95_ms': bench.percentile(self.durations, 95) * 1000,
+                'p99_ms': bench.percentile(self.durations, 99) * 1000,
+            }
+            results[str(clients)] = stats
+            self.stdout.write(
+                '{:>12}{requests:>12}{errors:>10}{locked:>10}'
+                '{req_per_sec:>12.1f}{p50_ms:>12.2f}{p95_ms:>12.2f}'.format(
+                    '{}+{}'.format(clients, readers) if readers else clients,
+                    **stats))
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'url': self.url, 'results': results}, output,
+                          indent=2)
+            self.stdout.write('Results saved to {}'.format(options['output']))
+
+    def request(self, method, path, token=None, data=None):
+        """
+        Status code and decoded JSON body of one request, the body of an
+        error is the raw text
+        """
+        headers = {'Accept': 'application/json'}
+        if token:
+            headers['Authorization'] = 'Token ' + token
+        body = urlencode(data).encode() if data is not None else None
+        request = Request(self.url + path, data=body, headers=headers,
+                          method=method)
+        try:
+            with urlopen(request) as response:
+                return response.status, json.loads(response.read().decode())
+        except HTTPError as error:
+            try:
+                return error.code, error.read().decode('utf-8', 'replace')
+            except OSError:
+                return error.code, ''
+        except OSError as error:
+            # Connection refused or reset, counted as a server error
+            return 599, str(error)
+
+    def login(self, preferences=False):
+        """ Register a fresh user, its token """
+        credentials = {'username': 'bench-' + uuid.uuid4().hex[:12],
+                       'password': uuid.uuid4().hex}
+        self.request('POST', '/api/user/', data=credentials)
+        _, body = self.request('POST', '/api/user/login/', data=credentials)
+        if preferences:
+            self.request('PUT', '/api/user/preferences/', body['token'],
+                         self.preferences())
+        return body['token']
+
+    def preferences(self):
+        with self.lock:
+            return {
+                'age': ','.join(sorted(
+                    self.rand.sample('byas', self.rand.randint(1, 4)))),
+                'gender': 'm,f',
+                'size': 's,m,l,xl',
+            }
+
+    def timed_request(self, *args, **kwargs):
+        start = time.perf_counter()
+        status, body = self.request(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.durations.append(elapsed)
+            if status >= 400 and status != 404:
+                self.errors += 1
+                if 'database is locked' in body:
+                    self.locked += 1
+        return status, body
+
+    def swipe(self, token, swipes):
+        """
+        Set preferences, which rebuilds the deck of the user, get the first
+        undecided dog, then like or dislike swipes times
+        """
+        self.timed_request('PUT', '/api/user/preferences/', token,
+                           self.preferences())
+        status, dog = self.timed_request(
+            'GET', '/api/dog/-1/undecided/next/', token)
+        for _ in range(swipes):
+            if status != 200:
+                break
+            choice = 'liked' if dog['id'] % 2 else 'disliked'
+            status, dog = self.timed_request(
+                'PUT', '/api/dog/{}/{}/'.format(dog['id'], choice), token)
+
+    def browse(self, token, pages):
+        """ Fetch decks and the liked dogs, pages times each """
+        for _ in range(pages):
+            self.timed_request('GET', '/api/dog/-1/undecided/deck/', token)
+            self.timed_request('GET', '/api/user/dogs/?status=liked', token)
@@ -0,0 +1,80 @@
+import random
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+
+from pugorugh import bench
+from pugorugh import preferences
+
+
+class Command(BaseCommand):
+    help = ('Compare query plans and latencies of the swipe queries '
+            'without and with the composite indexes of 0003_indexes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dogs', type=int, default=100000)
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--rows-per-user', type=int, default=50)
+        parser.add_argument('--samples', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with bench.scratch_database():
+            self.stdout.write('Generating {dogs} dogs and {users} '
+                              'users...'.format(**options))
+            dog_ids = bench.create_dogs(options['dogs'])
+            user_ids = bench.create_users(options['users'])
+            bench.create_user_dogs(
+                user_ids, dog_ids, options['rows_per_user'])
+            samples = random.Random(1).sample(
+                user_ids, min(options['samples'], len(user_ids)))
+
+            self.migrate('0002_auto_20191106_1935')
+            self.report('Before (0002)', samples)
+            self.migrate('0003_indexes')
+            self.report('After (0003)', samples)
+            call_command('migrate', 'pugorugh', verbosity=0)
+
+    def migrate(self, target):
+        """
+        Migrate the scratch database to target, the queries then use the
+        models of that migration: the current ones have later columns
+        """
+        call_command('migrate', 'pugorugh', target, verbosity=0)
+        self.apps = MigrationLoader(connection).project_state(
+            ('pugorugh', target)).apps
+
+    def queries(self, user_id):
+        """ The next dog and status lookups issued by the swipe views """
+        Dog = self.apps.get_model('pugorugh', 'Dog')
+        UserDog = self.apps.get_model('pugorugh', 'UserDog')
+        UserPref = self.apps.get_model('pugorugh', 'UserPref')
+        dogs = Dog.objects.filter(preferences.compile_filter(
+            UserPref.objects.get(user=user_id)))
+        dog_id = UserDog.objects.filter(
+            user=user_id).values_list('dog_id', flat=True).first()
+        matching = dogs.filter(id__gt=dog_id).order_by('id')[:1]
+        next_dog = dogs.filter(
+            userdog__status__exact='u', userdog__user=user_id,
+            id__gt=dog_id).order_by('id')[:1]
+        user_dog = UserDog.objects.filter(user=user_id, dog=dog_id)
+        return (('matching_dog', matching), ('next_dog', next_dog),
+                ('user_dog', user_dog))
+
+    def report(self, title, samples):
+        self.stdout.write('\n== {} =='.format(title))
+        durations = {}
+        for user_id in samples:
+            for name, queryset in self.queries(user_id):
+                _, elapsed = bench.timed(bench.execute, queryset)
+                durations.setdefault(name, []).append(elapsed * 1000)
+        for name, queryset in self.queries(samples[0]):
+            self.stdout.write('{}:'.format(name))
+            for line in bench.query_plan(queryset):
+                self.stdout.write('    {}'.format(line))
+            self.stdout.write(
+                '    p50 {:.3f} ms  p95 {:.3f} ms  max {:.3f} ms'.format(
+                    bench.percentile(durations[name], 50),
+                    bench.percentile(durations[name], 95),
+                    max(durations[name])))
@@ -0,0 +1,59 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pugorugh import bench
+from pugorugh import preferences
+from pugorugh import ranking
+
+
+class Command(BaseCommand):
+    help = 'Measure the ranking of undecided dogs on a synthetic catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dogs', type=int, default=100000)
+        parser.add_argument('--decisions', type=int, default=200,
+                            help='Liked/disliked dogs of the user')
+        parser.add_argument('--rounds', type=int, default=200)
+
+    def handle(self, *args, **options):
+        if ranking.np is None:
+            raise CommandError('NumPy is required by the ranking.')
+        with bench.scratch_database():
+            dog_ids = bench.create_dogs(options['dogs'])
+            user_id = bench.create_users(1)[0]
+            bench.create_user_dogs([user_id], dog_ids, options['decisions'])
+            user = bench.User.objects.get(id=user_id)
+            prefs = preferences.get_preferences(user)
+
+            features, load = bench.timed(ranking.DogFeatures.load)
+            self.stdout.write('Features of {} dogs loaded in {:.1f} ms'
+                              .format(len(features.ids), load * 1000))
+            _, candidates, _ = ranking.rank(user)
+            self.stdout.write('{} candidates, {} liked/disliked dogs'.format(
+                int(candidates.sum()), options['decisions']))
+            rows = features.positions(random.Random(0).sample(
+                dog_ids, options['decisions']))
+            liked, disliked = rows[::2], rows[1::2]
+
+            def score():
+                mask = features.matching(prefs)
+                mask[rows] = False
+                scores = features.scores(liked, disliked)
+                return features.next_id(mask, scores, dog_ids[0])
+
+            cases = (
+                ('scoring only', score),
+                ('next_dog_id', lambda: ranking.next_dog_id(
+                    user, dog_ids[0])),
+                ('next_dog_ids(10)', lambda: ranking.next_dog_ids(
+                    user, dog_ids[0], 10)),
+            )
+            for name, func in cases:
+                durations = [bench.timed(func)[1]
+                             for _ in range(options['rounds'])]
+                self.stdout.write(
+                    '{:<18} p50 {:.3f} ms  p95 {:.3f} ms  p99 {:.3f} ms'
+                    .format(name, bench.percentile(durations, 50) * 1000,
+                            bench.percentile(durations, 95) * 1000,
+                            bench.percentile(durations, 99) * 1000))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from pugorugh import bench
+from pugorugh import models
+from pugorugh.serializers import DogSerializer, dog_data, dog_rows
+
+
+class Command(BaseCommand):
+    help = ('Compare the serialization throughput of DogSerializer with '
+            'the dog_data/dog_rows fast path')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[1, 100, 10000])
+        parser.add_argument('--rounds', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with bench.scratch_database():
+            bench.create_dogs(max(options['sizes']))
+            self.stdout.write('{:>6}  {:>18}  {:>12}  {:>12}  {:>7}'.format(
+                'dogs', 'path', 'median ms', 'dogs/s', 'speedup'))
+            for size in options['sizes']:
+                # A fresh queryset each round: fetching is measured too
+                def queryset():
+                    return models.Dog.objects.order_by('id')[:size]
+                paths = (
+                    ('DogSerializer', lambda: DogSerializer(
+                        queryset(), many=True).data),
+                    ('dog_data',
+                     lambda: [dog_data(dog) for dog in queryset()]),
+                    ('dog_rows', lambda: dog_rows(queryset())),
+                )
+                baseline = None
+                for name, func in paths:
+                    durations = [bench.timed(func)[1]
+                                 for _ in range(options['rounds'])]
+                    median = bench.percentile(durations, 50)
+                    baseline = baseline or median
+                    self.stdout.write(
+                        '{:>6}  {:>18}  {:>12.3f}  {:>12.0f}  {:>6.1f}x'
+                        .format(size, name, median * 1000, size / median,
+                                baseline / median))
@@ -0,0 +1,136 @@
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+
+import django
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from pugorugh import bench
+
+
+COLUMNS = ('rounds', 'p50_ms', 'p95_ms', 'p99_ms', 'ops_per_sec',
+           'queries_mean')
+
+
+class Command(BaseCommand):
+    help = ('Drive register -> preferences -> swipes -> liked dogs through '
+            'the test client on synthetic catalogs and report latency, '
+            'throughput and queries per operation')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dogs', type=int, nargs='+', default=[1000],
+                            help='Catalog sizes, e.g. 1000 100000 1000000')
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--swipes', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Save the results as JSON')
+        parser.add_argument('--compare',
+                            help='JSON results of a previous run to compare')
+
+    def handle(self, *args, **options):
+        results = {
+            'meta': {
+                'commit': git_commit(),
+                'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'users': options['users'],
+                'swipes': options['swipes'],
+            },
+            'catalogs': {},
+        }
+        for dogs in options['dogs']:
+            with bench.scratch_database(), override_settings(
+                    ALLOWED_HOSTS=['testserver']):
+                self.stdout.write('Catalog of {} dogs...'.format(dogs))
+                bench.create_dogs(dogs, seed=options['seed'])
+                benchmark = bench.Benchmark()
+                rand = random.Random(options['seed'])
+                for number in range(options['users']):
+                    self.run_user(benchmark, rand, number, options['swipes'])
+                stats = benchmark.stats()
+            results['catalogs'][str(dogs)] = stats
+            self.report(stats)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write('Results saved to {}'.format(options['output']))
+        if options['compare']:
+            with open(options['compare']) as previous:
+                self.compare(json.load(previous), results)
+
+    def run_user(self, benchmark, rand, number, swipes):
+        """ The journey of one user through the app """
+        client = APIClient()
+        credentials = {'username': 'user{}'.format(number),
+                       'password': 'secret{}'.format(number)}
+        with benchmark.measure('register'):
+            client.post('/api/user/', credentials)
+        with benchmark.measure('login'):
+            token = client.post('/api/user/login/', credentials).data['token']
+        client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        preferences = {
+            'age': ','.join(sorted(rand.sample('byas', rand.randint(1, 4)))),
+            'gender': ','.join(rand.sample('mf', rand.randint(1, 2))),
+            'size': ','.join(rand.sample(('s', 'm', 'l', 'xl'),
+                                         rand.randint(1, 4))),
+        }
+        with benchmark.measure('set_preferences'):
+            client.put('/api/user/preferences/', preferences)
+
+        with benchmark.measure('next_dog'):
+            response = client.get('/api/dog/-1/undecided/next/')
+        for _ in range(swipes):
+            if response.status_code != 200:
+                break
+            status = rand.choice(('liked', 'disliked'))
+            with benchmark.measure('change_status'):
+                response = client.put('/api/dog/{}/{}/'.format(
+                    response.data['id'], status))
+
+        url = '/api/user/dogs/?status=liked&page_size=50'
+        while url:
+            with benchmark.measure('liked_dogs'):
+                response = client.get(url)
+            url = response.data['next']
+
+    def report(self, stats):
+        self.stdout.write('{:<16}'.format('operation') + ''.join(
+            '{:>14}'.format(column) for column in COLUMNS))
+        for operation, values in stats.items():
+            self.stdout.write('{:<16}'.format(operation) + ''.join(
+                '{:>14.2f}'.format(values[column]) if isinstance(
+                    values[column], float) else
+                '{:>14}'.format(values[column]) for column in COLUMNS))
+
+    def compare(self, previous, current):
+        self.stdout.write('\nChange of p50 against commit {}:'.format(
+            previous['meta'].get('commit')))
+        for dogs, stats in current['catalogs'].items():
+            before = previous['catalogs'].get(dogs, {})
+            for operation, values in stats.items():
+                if operation not in before:
+                    continue
+                old = before[operation]['p50_ms']
+                ratio = values['p50_ms'] / old if old else float('inf')
+                self.stdout.write(
+                    '{:>8} dogs  {:<16} {:>10.2f} -> {:>10.2f} ms '
+                    '({:+.0%})'.format(dogs, operation, old,
+                                       values['p50_ms'], ratio - 1))
+
+
+def git_commit():
+    """ Commit the benchmark ran on, None outside of a git checkout """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pugorugh import catalog
+from pugorugh import images
+
+
+class Command(BaseCommand):
+    help = ('Resize the dog photos to a few widths as JPEG/WebP files with '
+            'content-hashed names and a manifest, skipping unchanged '
+            'photos. Requires Pillow')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--widths', type=int, nargs='+',
+                            default=list(images.WIDTHS))
+        parser.add_argument('--formats', nargs='+', choices=images.FORMATS,
+                            default=list(images.FORMATS))
+        parser.add_argument('--quality', type=int, default=images.QUALITY)
+        parser.add_argument('--workers', type=int,
+                            help='Processes, one per CPU by default')
+        parser.add_argument('--force', action='store_true',
+                            help='Rebuild the unchanged photos too')
+
+    def handle(self, *args, **options):
+        if images.Image is None:
+            raise CommandError('Pillow is required: pip install Pillow')
+        skipped_formats = set(options['formats']).difference(
+            images.available_formats(options['formats']))
+        if skipped_formats:
+            self.stderr.write('Pillow can not write {} here, skipped'.format(
+                ', '.join(sorted(skipped_formats))))
+        start = time.perf_counter()
+        built, skipped, removed = images.build(
+            sorted(set(options['widths'])), options['formats'],
+            options['quality'], options['workers'], options['force'])
+        if built or removed:
+            # New urls in the dog payloads, refresh ETags and cached dogs
+            catalog.bump_version()
+        self.stdout.write(
+            '{} photo(s) built, {} unchanged, {} stale file(s) removed '
+            'in {:.1f}s'.format(built, skipped, removed,
+                                time.perf_counter() - start))
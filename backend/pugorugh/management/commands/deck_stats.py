@@ -0,0 +1,26 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from pugorugh import counters
+
+
+class Command(BaseCommand):
+    help = ('Check the liked/disliked/undecided counters of every user '
+            'against their UserDog rows, and rebuild the wrong ones with '
+            '--fix')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Recount the users whose counters differ')
+
+    def handle(self, *args, **options):
+        mismatches = counters.verify()
+        for user_id, (stored, actual) in sorted(mismatches.items()):
+            self.stdout.write('user {}: stored {} actual {}'.format(
+                user_id, stored, actual))
+        self.stdout.write('{} user(s) with wrong counters'.format(
+            len(mismatches)))
+        if options['fix'] and mismatches:
+            for user_id in sorted(mismatches):
+                counters.recount(User(id=user_id))
+            self.stdout.write('Recounted {} user(s)'.format(len(mismatches)))
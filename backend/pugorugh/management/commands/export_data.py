@@ -0,0 +1,69 @@
+import io
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from pugorugh import exports
+from pugorugh import models
+
+
+class Command(BaseCommand):
+    help = ('Stream the dog catalog or the liked/disliked/undecided '
+            'statuses of the users as JSON lines or CSV, with constant '
+            'memory use. Decisions can be limited to the ones modified '
+            'since the end of a previous export')
+
+    def add_arguments(self, parser):
+        parser.add_argument('what', choices=('dogs', 'decisions'))
+        parser.add_argument('--format', default='ndjson',
+                            choices=sorted(exports.FORMATS))
+        parser.add_argument('--output',
+                            help='Write to this file instead of stdout')
+        parser.add_argument('--chunk-size', type=int,
+                            default=exports.CHUNK_SIZE)
+        parser.add_argument('--user', help='Username of the decisions, '
+                                           'every user by default')
+        parser.add_argument('--status', choices=sorted(
+            models.UserDog.STATUSES))
+        parser.add_argument('--since', help='Only the decisions modified '
+                                            'since this ISO 8601 time')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if options['what'] == 'dogs':
+            batches = exports.dog_batches(chunk_size)
+            columns = exports.DOG_COLUMNS
+            until = None
+        else:
+            user = None
+            if options['user']:
+                try:
+                    user = User.objects.get(username=options['user'])
+                except User.DoesNotExist:
+                    raise CommandError(
+                        'No user named {}'.format(options['user']))
+            since = None
+            if options['since']:
+                try:
+                    since = exports.parse_since(options['since'])
+                except ValueError as error:
+                    raise CommandError('--since: {}'.format(error))
+            until = exports.export_until()
+            user_dogs = exports.decisions(
+                user, models.UserDog.STATUSES.get(options['status']), since,
+                until)
+            batches = exports.decision_batches(user_dogs, chunk_size)
+            columns = exports.DECISION_COLUMNS
+
+        chunks = exports.encode(batches, columns, options['format'])
+        if options['output']:
+            with io.open(options['output'], 'w', encoding='utf-8',
+                         newline='') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+        if until is not None:
+            # Where the next incremental export starts
+            self.stderr.write('--since {}'.format(until.isoformat()))
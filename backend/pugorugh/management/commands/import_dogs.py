@@ -0,0 +1,42 @@
+import io
+import sys
+from os import path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from pugorugh.importer import BATCH_SIZE, DogImporter
+
+
+DEFAULT_FILE = path.join(settings.BASE_DIR, 'pugorugh', 'static',
+                         'dog_details.json')
+
+
+class Command(BaseCommand):
+    help = ('Stream dogs from a JSON array or JSON lines file into the '
+            'database, updating dogs with the same image_filename')
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', nargs='?', default=DEFAULT_FILE)
+        parser.add_argument('--chunk-size', type=int,
+                            default=BATCH_SIZE)
+        parser.add_argument(
+            '--errors', help='Write rejected records to this file '
+                             '(JSON lines) instead of stderr')
+
+    def handle(self, *args, **options):
+        if options['errors']:
+            errors = io.open(options['errors'], 'w', encoding='utf-8')
+        else:
+            errors = sys.stderr
+        try:
+            with io.open(options['file'], 'r', encoding='utf-8') as fp:
+                importer = DogImporter(options['chunk_size'], errors)
+                importer.run(fp)
+        except ValueError as error:
+            # The chunks read before a malformed array are imported
+            raise CommandError(error)
+        finally:
+            if errors is not sys.stderr:
+                errors.close()
+        self.stdout.write(importer.summary())
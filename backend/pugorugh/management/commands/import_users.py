@@ -0,0 +1,48 @@
+import io
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pugorugh.importer import BATCH_SIZE, UserImporter
+
+
+class Command(BaseCommand):
+    help = ('Create users from a JSON array or JSON lines file of '
+            '{"username", "password", "email"} records, with default '
+            'preferences and a token, hashing passwords in parallel')
+
+    def add_arguments(self, parser):
+        parser.add_argument('file')
+        parser.add_argument('--chunk-size', type=int,
+                            default=BATCH_SIZE)
+        parser.add_argument('--workers', type=int,
+                            help='Password hashing processes, one per CPU '
+                                 'by default')
+        parser.add_argument(
+            '--errors', help='Write rejected records to this file '
+                             '(JSON lines) instead of stderr')
+        parser.add_argument(
+            '--tokens', help='Write the created users and their token to '
+                             'this file (JSON lines)')
+
+    def handle(self, *args, **options):
+        errors = sys.stderr
+        tokens = None
+        try:
+            if options['errors']:
+                errors = io.open(options['errors'], 'w', encoding='utf-8')
+            if options['tokens']:
+                tokens = io.open(options['tokens'], 'w', encoding='utf-8')
+            with io.open(options['file'], 'r', encoding='utf-8') as fp:
+                importer = UserImporter(options['chunk_size'], errors,
+                                        tokens, options['workers'])
+                importer.run(fp)
+        except ValueError as error:
+            # The chunks read before a malformed array are imported
+            raise CommandError(error)
+        finally:
+            if errors is not sys.stderr:
+                errors.close()
+            if tokens is not None:
+                tokens.close()
+        self.stdout.write(importer.summary())
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pugorugh import jobs
+
+
+class Command(BaseCommand):
+    help = ('Worker of the database job runner: run the pending UserDog '
+            'reconciliation jobs, polling for new ones')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the pending jobs ran')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds between two polls')
+        parser.add_argument('--batch', type=int, default=100,
+                            help='Jobs run per poll at most')
+
+    def handle(self, *args, **options):
+        while True:
+            count = jobs.run_pending(options['batch'])
+            if count:
+                self.stdout.write('Ran {} job(s)'.format(count))
+            if options['once'] and count < options['batch']:
+                return
+            if not count:
+                time.sleep(options['interval'])
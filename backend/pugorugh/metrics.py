@@ -0,0 +1,177 @@
+"""
+Per-request SQL and latency metrics
+QueryMetricsMiddleware, enabled by PUGORUGH_METRICS, measures the query
+count, database time, view time, total time and response size of each
+request. They are sent back as a Server-Timing header, logged as a JSON
+line on the 'pugorugh.metrics' logger and aggregated per url name into
+histograms that /api/_metrics/ exposes in the Prometheus text format,
+along with gauges set by other modules (the size of the bitmap index).
+Aggregates are kept per process.
+"""
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+logger = logging.getLogger('pugorugh.metrics')
+
+# Upper bounds of the histogram buckets
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERIES_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144)
+
+
+class Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Registry(object):
+    """ Histograms by metric name and url name, and gauges by name """
+    metrics = (
+        ('request_duration_seconds', 'Total time spent on the request',
+         SECONDS_BUCKETS),
+        ('view_duration_seconds', 'Time spent in the view',
+         SECONDS_BUCKETS),
+        ('db_duration_seconds', 'Time spent running SQL queries',
+         SECONDS_BUCKETS),
+        ('db_queries', 'SQL queries run per request', QUERIES_BUCKETS),
+        ('response_bytes', 'Size of the response body', BYTES_BUCKETS),
+    )
+    gauges = (
+        ('bitset_index_dogs', 'Dogs in the bitmap index of the catalog'),
+        ('bitset_index_bytes',
+         'Approximate memory used by the bitmap index of the catalog'),
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.values = {}
+
+    def observe(self, url_name, values):
+        with self.lock:
+            for name, _, buckets in self.metrics:
+                key = (name, url_name)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(buckets)
+                self.histograms[key].observe(values[name])
+
+    def set_gauge(self, name, value):
+        with self.lock:
+            self.values[name] = value
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+            self.values.clear()
+
+    def render(self):
+        """ Prometheus text exposition format """
+        lines = []
+        with self.lock:
+            for name, description, _ in self.metrics:
+                metric = 'pugorugh_' + name
+                lines.append('# HELP {} {}'.format(metric, description))
+                lines.append('# TYPE {} histogram'.format(metric))
+                for (key, url_name), histogram in sorted(
+                        self.histograms.items()):
+                    if key != name:
+                        continue
+                    label = 'url_name="{}"'.format(url_name)
+                    for bound, count in zip(histogram.buckets,
+                                            histogram.counts):
+                        lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                            metric, label, bound, count))
+                    lines.append('{}_bucket{{{},le="+Inf"}} {}'.format(
+                        metric, label, histogram.count))
+                    lines.append('{}_sum{{{}}} {}'.format(
+                        metric, label, histogram.sum))
+                    lines.append('{}_count{{{}}} {}'.format(
+                        metric, label, histogram.count))
+            for name, description in self.gauges:
+                if name not in self.values:
+                    continue
+                metric = 'pugorugh_' + name
+                lines.append('# HELP {} {}'.format(metric, description))
+                lines.append('# TYPE {} gauge'.format(metric))
+                lines.append('{} {}'.format(metric, self.values[name]))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def query_log_sizes():
+    return {conn.alias: len(conn.queries_log) for conn in connections.all()}
+
+
+class QueryMetricsMiddleware(object):
+    """
+    Should come first in MIDDLEWARE_CLASSES so the total time covers the
+    other middlewares. The debug cursor is forced to record queries, the
+    query log is reset by Django at the start of every request.
+    """
+
+    def __init__(self):
+        if not getattr(settings, 'PUGORUGH_METRICS', False):
+            raise MiddlewareNotUsed
+
+    def process_request(self, request):
+        for conn in connections.all():
+            conn.force_debug_cursor = True
+        request.metrics_start = time.perf_counter()
+        request.metrics_queries = query_log_sizes()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view_start = time.perf_counter()
+
+    def process_response(self, request, response):
+        if not hasattr(request, 'metrics_start'):
+            return response
+        end = time.perf_counter()
+        queries = 0
+        db_seconds = 0.0
+        for conn in connections.all():
+            start = request.metrics_queries.get(conn.alias, 0)
+            executed = list(conn.queries_log)[start:]
+            queries += len(executed)
+            db_seconds += sum(float(query['time']) for query in executed)
+        view_start = getattr(request, 'metrics_view_start', end)
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.url_name if match and match.url_name else 'other'
+        values = {
+            'request_duration_seconds': end - request.metrics_start,
+            'view_duration_seconds': end - view_start,
+            'db_duration_seconds': db_seconds,
+            'db_queries': queries,
+            'response_bytes': (0 if response.streaming
+                               else len(response.content)),
+        }
+        registry.observe(url_name, values)
+        response['Server-Timing'] = (
+            'db;dur={:.1f};desc="{} queries", view;dur={:.1f}, '
+            'total;dur={:.1f}'.format(
+                db_seconds * 1000, queries,
+                values['view_duration_seconds'] * 1000,
+                values['request_duration_seconds'] * 1000))
+        logger.info(json.dumps(dict(
+            values, url_name=url_name, method=request.method,
+            path=request.path, status=response.status_code)))
+        return response
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.9 on 2026-10-18 08:23
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def delete_duplicate_user_dogs(apps, schema_editor):
+    """ Keep the last row of each user and dog, the latest decision """
+    UserDog = apps.get_model('pugorugh', 'UserDog')
+    duplicates = UserDog.objects.values('user', 'dog').annotate(
+        rows=Count('id'), last=Max('id')).filter(rows__gt=1)
+    for duplicate in duplicates:
+        UserDog.objects.filter(
+            user=duplicate['user'], dog=duplicate['dog']).exclude(
+                id=duplicate['last']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pugorugh', '0002_auto_20191106_1935'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_user_dogs,
+                             migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='userdog',
+            unique_together=set([('user', 'dog')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='dog',
+            index_together=set([('gender', 'size', 'age', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='userdog',
+            index_together=set([('user', 'status', 'dog')]),
+        ),
+    ]
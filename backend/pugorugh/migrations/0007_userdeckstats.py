@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.9 on 2026-10-18 08:41
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('pugorugh', '0006_reconcilejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserDeckStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('liked', models.IntegerField(default=0)),
+                ('disliked', models.IntegerField(default=0)),
+                ('undecided', models.IntegerField(default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='deck_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
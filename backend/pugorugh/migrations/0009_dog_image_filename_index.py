@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.9 on 2026-10-18 09:36
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pugorugh', '0008_userdog_modified'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dog',
+            name='image_filename',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.9 on 2026-10-18 09:47
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pugorugh', '0009_dog_image_filename_index'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='userdog',
+            index_together=set([('user', 'status', 'dog'), ('user', 'modified')]),
+        ),
+    ]
@@ -2,9 +2,19 @@ from django.contrib.auth.models import User
 from django.db import models
 
 
+# Months of age (inclusive bounds) covered by each age preference
+AGE_RANGES = {
+    'b': (1, 10),
+    'y': (11, 29),
+    'a': (30, 69),
+    's': (70, 99),
+}
+
+
 class Dog(models.Model):
     name = models.CharField(max_length=255, blank=True)
-    image_filename = models.CharField(max_length=255)
+    # Dogs are matched on it by the importers
+    image_filename = models.CharField(max_length=255, db_index=True)
     breed = models.CharField(max_length=255, blank=True, default="")
     age = models.IntegerField()
     gender = models.CharField(
@@ -17,18 +27,41 @@ class Dog(models.Model):
                  ('xl', 'Extra large'), ('u', 'Unknown')]
     )
 
+    class Meta:
+        # Preference filter on gender/size/age, keyset navigation on id
+        index_together = [('gender', 'size', 'age', 'id')]
+
     def __str__(self):
         return self.name
 
 
 class UserDog(models.Model):
+    LIKED = 'l'
+    DISLIKED = 'd'
+    UNDECIDED = 'u'
+    # Status codes by their name in the API urls
+    STATUSES = {
+        'liked': LIKED,
+        'disliked': DISLIKED,
+        'undecided': UNDECIDED,
+    }
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     dog = models.ForeignKey(Dog, on_delete=models.CASCADE)
     status = models.CharField(
         max_length=1,
-        choices=[('l', 'Liked'), ('d', 'Disliked')],
-        default='u',
+        choices=[(LIKED, 'Liked'), (DISLIKED, 'Disliked'),
+                 (UNDECIDED, 'Undecided')],
+        default=UNDECIDED,
     )
+    # Last change of the status, for incremental exports. QuerySet.update()
+    # skips auto_now, the views set it along with the status
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [('user', 'dog')]
+        # (user, modified) serves the incremental exports of a user
+        index_together = [('user', 'status', 'dog'), ('user', 'modified')]
 
 
 class UserPref(models.Model):
@@ -36,3 +69,59 @@ class UserPref(models.Model):
     age = models.CharField(max_length=8, default='b,y,a,s')
     gender = models.CharField(max_length=4, default='m,f')
     size = models.CharField(max_length=9, default='s,m,l,xl')
+
+
+class Catalog(models.Model):
+    """
+    Single row versioning the Dog catalog, the version is bumped each
+    time dogs are edited or imported
+    """
+    version = models.PositiveIntegerField(default=1)
+    modified = models.DateTimeField(auto_now=True)
+
+
+class ReconcileJob(models.Model):
+    """
+    Background rebuild of the UserDog rows of a user after their
+    preferences changed, see pugorugh.jobs
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    status = models.CharField(
+        max_length=7,
+        choices=[(PENDING, 'Pending'), (RUNNING, 'Running'),
+                 (DONE, 'Done'), (FAILED, 'Failed')],
+        default=PENDING,
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    created_dogs = models.PositiveIntegerField(default=0)
+    deleted_dogs = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+
+    class Meta:
+        index_together = [('status', 'id')]
+
+    @property
+    def duration(self):
+        """ Seconds spent running the job, None until it finished """
+        if self.started is None or self.finished is None:
+            return None
+        return (self.finished - self.started).total_seconds()
+
+
+class UserDeckStats(models.Model):
+    """
+    Number of UserDog rows of a user per status, kept up to date with
+    F() expressions by the views changing statuses (see pugorugh.counters)
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                related_name='deck_stats')
+    liked = models.IntegerField(default=0)
+    disliked = models.IntegerField(default=0)
+    undecided = models.IntegerField(default=0)
@@ -0,0 +1,105 @@
+"""
+Compiled User preferences
+The comma-separated age/gender/size preferences are parsed into a
+Preferences tuple, from which the Q object filtering Dog is built.
+Parsed preferences are cached per user in the cache named by
+PUGORUGH_PREF_CACHE, see pugorugh.shared, and invalidated when the
+preferences are updated through the API. Without it they are read on
+every request.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models import Q
+
+from . import models
+from .shared import get_shared_cache
+
+
+CACHE_KEY = 'pugorugh:preferences:{}'
+
+Preferences = namedtuple('Preferences', ['genders', 'sizes', 'ages'])
+
+
+def get_cache():
+    """ The shared cache of the preferences, None when not configured """
+    return get_shared_cache(getattr(settings, 'PUGORUGH_PREF_CACHE', None),
+                            'PUGORUGH_PREF_CACHE')
+
+
+def age_group(age):
+    """ Age preference code covering an age in months, None if none """
+    for code, (low, high) in models.AGE_RANGES.items():
+        if low <= age <= high:
+            return code
+    return None
+
+
+def convert_dog_age(prefered_age):
+    """
+    Inspection of data range showed a dogs age between  2 and 96 months
+    This function changes the selected preference into numerical ranges,
+    adjacent ranges are merged so at most four age__range are OR-ed
+    """
+    ranges = sorted(models.AGE_RANGES[item]
+                    for item in set(prefered_age.split(','))
+                    if item in models.AGE_RANGES)
+    merged = []
+    for low, high in ranges:
+        if merged and low == merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], high)
+        else:
+            merged.append((low, high))
+    # No valid age group matches no dog at all
+    query = Q(pk__in=[])
+    for age_range in merged:
+        query |= Q(age__range=age_range)
+    return query
+
+
+def parse(user_pref):
+    """ Preferences of a UserPref, unknown age groups are dropped """
+    return Preferences(
+        genders=tuple(user_pref.gender.split(',')),
+        sizes=tuple(user_pref.size.split(',')),
+        ages=tuple(sorted(set(user_pref.age.split(',')).intersection(
+            models.AGE_RANGES))),
+    )
+
+
+def to_filter(prefs):
+    """ Q object selecting the dogs matching parsed Preferences """
+    return (convert_dog_age(','.join(prefs.ages)) &
+            Q(gender__in=prefs.genders) &
+            Q(size__in=prefs.sizes))
+
+
+def compile_filter(user_pref):
+    """ Q object selecting the dogs matching a UserPref """
+    return to_filter(parse(user_pref))
+
+
+def get_preferences(user):
+    """ Parsed preferences of a user, cached by user id """
+    cache = get_cache()
+    if cache is None:
+        return parse(models.UserPref.objects.get(user=user.id))
+    key = CACHE_KEY.format(user.id)
+    prefs = cache.get(key)
+    if prefs is None:
+        prefs = parse(models.UserPref.objects.get(user=user.id))
+        cache.set(key, prefs,
+                  getattr(settings, 'PUGORUGH_PREF_CACHE_TIMEOUT', 300))
+    return prefs
+
+
+def get_filter(user):
+    """ Compiled preference filter of a user """
+    return to_filter(get_preferences(user))
+
+
+def invalidate(user):
+    """ Forget the cached preferences after they changed """
+    cache = get_cache()
+    if cache is not None:
+        cache.delete(CACHE_KEY.format(user.id))
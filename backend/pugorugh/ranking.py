@@ -0,0 +1,177 @@
+"""
+Ranking of the undecided dogs of a user
+Every dog of the catalog is described by the codes of its gender, size,
+age group and breed, held in memory as NumPy arrays and rebuilt when the
+catalog version changes. The liked (+1) and disliked (-1) dogs of a user
+give an affinity to each attribute value, and a dog scores the sum of
+the affinities of its four attributes. The deck is walked from the best
+score down, ties in id order.
+
+Enabled by PUGORUGH_RANKING, requires NumPy.
+"""
+import threading
+
+from django.conf import settings
+
+from . import catalog
+from . import models
+from . import preferences
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+GENDERS = ('m', 'f', 'u')
+SIZES = ('s', 'm', 'l', 'xl', 'u')
+AGES = tuple(sorted(models.AGE_RANGES))
+
+
+def enabled():
+    return bool(getattr(settings, 'PUGORUGH_RANKING', False)) and (
+        np is not None)
+
+
+def codes(values, vocabulary):
+    """
+    Index of each value in vocabulary, len(vocabulary) when missing so
+    lookup tables get one extra, neutral, slot
+    """
+    index = {value: number for number, value in enumerate(vocabulary)}
+    missing = len(vocabulary)
+    return np.array([index.get(value, missing) for value in values],
+                    dtype=np.intp)
+
+
+def allowed(values, vocabulary):
+    """ Lookup table telling which codes of vocabulary are in values """
+    table = np.zeros(len(vocabulary) + 1, dtype=bool)
+    table[codes(values, vocabulary)] = True
+    table[len(vocabulary)] = False
+    return table
+
+
+class DogFeatures(object):
+    """ Attribute codes of the catalog, one row per dog in id order """
+
+    def __init__(self, rows):
+        ids, genders, sizes, ages, breeds = zip(*rows) if rows else (
+            (), (), (), (), ())
+        self.ids = np.array(ids, dtype=np.int64)
+        self.breeds = tuple(sorted(set(breeds)))
+        self.gender = codes(genders, GENDERS)
+        self.size = codes(sizes, SIZES)
+        self.age = codes([preferences.age_group(age) for age in ages], AGES)
+        self.breed = codes(breeds, self.breeds)
+
+    @classmethod
+    def load(cls):
+        return cls(list(models.Dog.objects.order_by('id').values_list(
+            'id', 'gender', 'size', 'age', 'breed')))
+
+    def positions(self, dog_ids):
+        """ Rows of the given dog ids, unknown ids are dropped """
+        dog_ids = np.asarray(dog_ids, dtype=np.int64)
+        if not len(self.ids) or not len(dog_ids):
+            return np.zeros(0, dtype=np.int64)
+        found = np.searchsorted(self.ids, dog_ids).clip(0, len(self.ids) - 1)
+        return found[self.ids[found] == dog_ids]
+
+    def matching(self, prefs):
+        """ Boolean mask of the dogs matching parsed Preferences """
+        return (allowed(prefs.genders, GENDERS)[self.gender] &
+                allowed(prefs.sizes, SIZES)[self.size] &
+                allowed(prefs.ages, AGES)[self.age])
+
+    def scores(self, liked, disliked):
+        """ Score of every dog given the rows of liked/disliked dogs """
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for column, width in ((self.gender, len(GENDERS)),
+                              (self.size, len(SIZES)),
+                              (self.age, len(AGES)),
+                              (self.breed, len(self.breeds))):
+            likes = np.bincount(column[liked], minlength=width + 1)
+            dislikes = np.bincount(column[disliked], minlength=width + 1)
+            affinity = ((likes - dislikes) /
+                        (likes + dislikes + 1.0)).astype(np.float32)
+            # Missing values do not weigh in
+            affinity[width] = 0
+            scores += affinity[column]
+        return scores
+
+    def next_id(self, candidates, scores, pk):
+        """
+        Candidate ranked right after dog pk, in (-score, id) order, the
+        best one when pk is not a candidate or was the last one
+        """
+        if not candidates.any():
+            return None
+        scores = np.where(candidates, scores, -np.inf)
+        current = self.positions([pk])
+        if len(current) and candidates[current[0]]:
+            score = scores[current[0]]
+            after = candidates & ((scores < score) |
+                                  ((scores == score) & (self.ids > pk)))
+            if after.any():
+                scores = np.where(after, scores, -np.inf)
+        # argmax keeps the first, so lowest id, of equal scores
+        return int(self.ids[int(np.argmax(scores))])
+
+    def next_ids(self, candidates, scores, pk, size):
+        """ Up to size candidates from the one after pk, wrapping around """
+        rows = np.flatnonzero(candidates)
+        ranked = rows[np.lexsort((self.ids[rows], -scores[rows]))]
+        current = np.flatnonzero(self.ids[ranked] == pk)
+        if len(current):
+            ranked = np.roll(ranked, -int(current[0]) - 1)
+        return [int(dog_id) for dog_id in self.ids[ranked[:size]]]
+
+
+class FeatureStore(object):
+    """ DogFeatures of the current catalog version, shared by threads """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.features = None
+
+    def get(self):
+        version, _ = catalog.get_version()
+        with self.lock:
+            if self.version != version:
+                self.features = DogFeatures.load()
+                self.version = version
+            return self.features
+
+
+store = FeatureStore()
+
+
+def rank(user):
+    """ Features, undecided candidates and scores for a user """
+    features = store.get()
+    decisions = list(models.UserDog.objects.filter(
+        user=user, status__in=(models.UserDog.LIKED,
+                               models.UserDog.DISLIKED),
+    ).values_list('dog_id', 'status'))
+    liked = features.positions([dog_id for dog_id, status in decisions
+                                if status == models.UserDog.LIKED])
+    disliked = features.positions([dog_id for dog_id, status in decisions
+                                   if status == models.UserDog.DISLIKED])
+    candidates = features.matching(preferences.get_preferences(user))
+    candidates[liked] = False
+    candidates[disliked] = False
+    return features, candidates, features.scores(liked, disliked)
+
+
+def next_dog_id(user, pk):
+    """ Best ranked undecided dog of a user after dog pk, None if none """
+    features, candidates, scores = rank(user)
+    return features.next_id(candidates, scores, pk)
+
+
+def next_dog_ids(user, pk, size):
+    """ Ids of the next size undecided dogs of a user in ranked order """
+    features, candidates, scores = rank(user)
+    return features.next_ids(candidates, scores, pk, size)
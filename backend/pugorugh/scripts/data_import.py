@@ -1,4 +1,3 @@
-import json
 from os import environ
 from os import path
 import sys
@@ -7,34 +6,24 @@ import django
 
 PROJ_DIR = path.dirname(path.dirname(path.dirname(path.abspath(__file__))))
 
+sys.path.append(PROJ_DIR)
+environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+django.setup()
+
+# Imported after django.setup(), it loads the models
+from pugorugh.importer import DogImporter  # noqa: E402
+
 
 def load_data():
     filepath = path.join(PROJ_DIR, 'pugorugh', 'static', 'dog_details.json')
-    
-    with open(filepath, 'r', encoding='utf-8') as file:
-        data = json.load(file)
 
-        serializer = DogSerializer(data=data, many=True)
-        if serializer.is_valid():
-            serializer.save()
-        else:
-            print(serializer.errors)
+    with open(filepath, 'r', encoding='utf-8') as file:
+        importer = DogImporter(errors=sys.stdout)
+        importer.run(file)
 
+    print(importer.summary())
     print('load_data done.')
 
 
 if __name__ == '__main__':
-    sys.path.append(PROJ_DIR)
-    environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
-    django.setup()
-
-    # Assuming your serializer is named DogSerializer
-    # has to be imported after django.setup()
-    try:
-
-        from pugorugh.serializers import DogSerializer
-    except ImportError:
-        raise ImportError('serializers.py must contain a properly '
-            'implemented DogSerializer class for this import to work.')
-
-    load_data()
\ No newline at end of file
+    load_data()
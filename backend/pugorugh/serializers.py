@@ -1,6 +1,9 @@
+from collections import OrderedDict
+
 from django.contrib.auth import get_user_model
 
 from rest_framework import serializers
+from . import images
 from . import models
 
 
@@ -8,8 +11,8 @@ class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
 
     def create(self, validated_data):
-        user = get_user_model().objects.create(
-            username=validated_data['username'],)
+        # Hashed before the INSERT so the user is written once
+        user = get_user_model()(username=validated_data['username'])
         user.set_password(validated_data['password'])
         user.save()
         return user
@@ -18,14 +21,75 @@ class UserSerializer(serializers.ModelSerializer):
         model = get_user_model()
 
 
+USERNAME = get_user_model()._meta.get_field('username')
+
+
+class UserImportSerializer(serializers.Serializer):
+    """ One user of a bulk import, usernames are checked per chunk """
+    username = serializers.CharField(
+        max_length=USERNAME.max_length, validators=USERNAME.validators)
+    password = serializers.CharField(write_only=True)
+    email = serializers.EmailField(required=False, allow_blank=True)
+
+
+DOG_FIELDS = ('id', 'name', 'image_filename',
+              'breed', 'age', 'gender', 'size')
+
+
 class DogSerializer(serializers.ModelSerializer):
+    # Urls of the resized photos by format and width, see pugorugh.images
+    images = serializers.SerializerMethodField()
+
     class Meta:
-        fields = ('id', 'name', 'image_filename',
-                  'breed', 'age', 'gender', 'size')
+        fields = DOG_FIELDS + ('images',)
         model = models.Dog
 
+    def get_images(self, dog):
+        return images.variant_urls.get(dog.image_filename)
+
+
+def dog_data(dog):
+    """ Same output as DogSerializer(dog).data, without the fields """
+    data = OrderedDict((field, getattr(dog, field)) for field in DOG_FIELDS)
+    data['images'] = images.variant_urls.get(dog.image_filename)
+    return data
+
+
+def dog_rows(queryset):
+    """
+    Same output as DogSerializer(queryset, many=True).data, built from
+    .values_list() rows so no model instance is created
+    """
+    rows = []
+    for row in queryset.values_list(*DOG_FIELDS):
+        data = OrderedDict(zip(DOG_FIELDS, row))
+        data['images'] = images.variant_urls.get(data['image_filename'])
+        rows.append(data)
+    return rows
+
 
 class UserPrefSerializer(serializers.ModelSerializer):
     class Meta:
         fields = ('age', 'gender', 'size')
         model = models.UserPref
+
+
+class DogStatusSerializer(serializers.Serializer):
+    dog_id = serializers.IntegerField()
+    status = serializers.ChoiceField(
+        choices=sorted(models.UserDog.STATUSES))
+
+
+class ReconcileJobSerializer(serializers.ModelSerializer):
+    duration = serializers.ReadOnlyField()
+
+    class Meta:
+        fields = ('id', 'status', 'created', 'started', 'finished',
+                  'duration', 'created_dogs', 'deleted_dogs', 'error')
+        model = models.ReconcileJob
+
+
+class UserDeckStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        fields = ('liked', 'disliked', 'undecided')
+        model = models.UserDeckStats
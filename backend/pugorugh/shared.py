@@ -0,0 +1,30 @@
+"""
+Django caches shared by every worker process
+Entries that one worker invalidates must be gone for all of them, which
+only holds for caches stored outside of the process (memcached, Redis,
+database or file based caches). The local memory cache, the default
+one, lives in each process: gunicorn workers and the run_jobs process
+would each keep their own stale copies.
+"""
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+
+
+# The dummy cache stores nothing, it can not go stale
+PROCESS_LOCAL = (LocMemCache,)
+
+
+def get_shared_cache(alias, setting):
+    """
+    The cache named alias, None when alias is None, setting is the name
+    of the setting holding it for the error of a per-process backend
+    """
+    if not alias:
+        return None
+    cache = caches[alias]
+    if isinstance(cache, PROCESS_LOCAL):
+        raise ImproperlyConfigured(
+            '{} = {!r} names a per-process cache ({}), it has to be shared '
+            'by every worker.'.format(setting, alias, type(cache).__name__))
+    return cache
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import authentication
+from . import catalog
+from . import models
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    authentication.invalidate(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def forget_user_tokens(sender, instance, created, **kwargs):
+    """ A deactivated or edited user must be resolved again """
+    if not created and authentication.get_cache_alias():
+        authentication.invalidate(*Token.objects.filter(
+            user=instance).values_list('key', flat=True))
+
+
+@receiver(post_save, sender=models.Dog)
+@receiver(post_delete, sender=models.Dog)
+def bump_catalog_version(sender, **kwargs):
+    catalog.bump_version()
+
+
+@receiver(connection_created)
+def set_sqlite_pragmas(sender, connection, **kwargs):
+    """ Apply PUGORUGH_SQLITE_PRAGMAS, unlogged, to new SQLite connections """
+    if connection.vendor != 'sqlite':
+        return
+    for name, value in getattr(settings, 'PUGORUGH_SQLITE_PRAGMAS', ()):
+        connection.connection.execute('PRAGMA {} = {}'.format(name, value))
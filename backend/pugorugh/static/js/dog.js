@@ -104,6 +104,27 @@ var Dog = React.createClass({
         );
     }
   },
+  photo: function () {
+    var details = this.state.details;
+    var images = details.images || {};
+    var src = "static/images/dogs/" + details.image_filename;
+    var sizes = "(max-width: 1080px) 100vw, 1080px";
+    var srcSet = function (urls) {
+      return Object.keys(urls).map(function (width) {
+        return urls[width] + " " + width + "w";
+      }).join(", ");
+    };
+
+    if (!images.jpeg) {
+      return React.createElement("img", { src: src });
+    }
+    return React.createElement(
+      "picture",
+      null,
+      images.webp ? React.createElement("source", { type: "image/webp", srcSet: srcSet(images.webp), sizes: sizes }) : null,
+      React.createElement("img", { src: src, srcSet: srcSet(images.jpeg), sizes: sizes })
+    );
+  },
   contents: function () {
     if (this.state.message !== undefined) {
       return React.createElement(
@@ -153,7 +174,7 @@ var Dog = React.createClass({
     return React.createElement(
       "div",
       null,
-      React.createElement("img", { src: "static/images/dogs/" + this.state.details.image_filename }),
+      this.photo(),
       React.createElement(
         "p",
         { className: "dog-card" },
@@ -88,6 +88,27 @@ var Dog = React.createClass({
         );
     }
   },
+  photo: function() {
+    var details = this.state.details;
+    var images = details.images || {};
+    var src = "static/images/dogs/" + details.image_filename;
+    var sizes = "(max-width: 1080px) 100vw, 1080px";
+    var srcSet = function(urls) {
+      return Object.keys(urls).map(function(width) {
+        return urls[width] + " " + width + "w";
+      }).join(", ");
+    };
+
+    if(!images.jpeg) {
+      return <img src={src} />;
+    }
+    return (
+      <picture>
+        {images.webp ? <source type="image/webp" srcSet={srcSet(images.webp)} sizes={sizes} /> : null}
+        <img src={src} srcSet={srcSet(images.jpeg)} sizes={sizes} />
+      </picture>
+    );
+  },
   contents: function() {
     if(this.state.message !== undefined) {
       return (
@@ -118,7 +139,7 @@ var Dog = React.createClass({
 
     return (
       <div>
-        <img src={"static/images/dogs/" + this.state.details.image_filename} />
+        {this.photo()}
         <p className="dog-card">
           {this.state.details.name}&bull;
           {this.state.details.breed}&bull;
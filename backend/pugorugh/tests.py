@@ -1,12 +1,72 @@
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
 from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.utils import timezone
+from django.db import connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.loader import MigrationLoader
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import (APIClient, APIRequestFactory, APITestCase,
                                  force_authenticate)
+
+from backend.routers import CatalogReadRouter
+from . import authentication
+from . import bench
+from . import bitsets
+from . import catalog
+from . import counters
+from . import cursors
+from . import exports
+from . import images
+from . import importer
+from . import jobs
+from . import metrics
 from . import models
+from . import preferences
+from . import ranking
+from . import serializers
 from . import views
 
 
+def clear_caches():
+    cache = preferences.get_cache()
+    if cache is not None:
+        cache.clear()
+
+
+def shared_cache(test_case, **settings):
+    """
+    Settings of a file based cache named 'shared', visible to every
+    process like memcached, the names of settings are set to its alias
+    """
+    directory = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, directory)
+    caches = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': directory},
+    }
+    return test_case.settings(
+        CACHES=caches, **{name: 'shared' for name in settings})
+
+
 class UnitModelsTest(TestCase):
 
     def setUp(self):
@@ -40,6 +100,23 @@ class UnitModelsTest(TestCase):
         self.assertEqual(dog_test.size, 'xl')
         self.assertNotEqual(dog_test.gender, 'm')
 
+    def test_dog_fast_serialization_identical(self):
+        models.Dog.objects.create(
+            name='Muffin', image_filename='3.jpg', breed='Boxer',
+            age=24, gender='f', size='xl'
+        )
+        models.Dog.objects.create(
+            name='', image_filename='4.jpg', age=2, gender='u', size='u')
+        dogs = models.Dog.objects.order_by('id')
+        renderer = JSONRenderer()
+        expected = renderer.render(
+            serializers.DogSerializer(dogs, many=True).data)
+        self.assertEqual(renderer.render(serializers.dog_rows(dogs)),
+                         expected)
+        self.assertEqual(
+            renderer.render([serializers.dog_data(dog) for dog in dogs]),
+            expected)
+
     def test_user_dog(self):
         user = models.User.objects.get(username='jonny')
         dog = models.Dog.objects.create(
@@ -50,9 +127,236 @@ class UnitModelsTest(TestCase):
         self.assertEqual(userdog.status, 'u')
 
 
+class DogAgeFilterTest(TestCase):
+
+    def setUp(self):
+        for age in (2, 10, 11, 29, 30, 69, 70, 99, 120):
+            models.Dog.objects.create(
+                name=str(age), image_filename='{}.jpg'.format(age),
+                age=age, gender='f', size='s')
+
+    def ages(self, preference):
+        dogs = models.Dog.objects.filter(
+            preferences.convert_dog_age(preference))
+        return sorted(dogs.values_list('age', flat=True))
+
+    def test_baby_not_reset_by_order(self):
+        self.assertEqual(self.ages('y,b'), [2, 10, 11, 29])
+        self.assertEqual(self.ages('b,y'), [2, 10, 11, 29])
+
+    def test_non_adjacent_groups(self):
+        self.assertEqual(self.ages('b,s'), [2, 10, 70, 99])
+        self.assertEqual(self.ages('b,y,a,s'),
+                         [2, 10, 11, 29, 30, 69, 70, 99])
+
+    def test_no_group_matches_nothing(self):
+        self.assertEqual(self.ages(''), [])
+
+
+class CachedTokenAuthenticationTest(TestCase):
+
+    def setUp(self):
+        authentication.local_cache.clear()
+        self.user = User.objects.create(username='jonny', password='12#$k')
+        self.token = Token.objects.create(user=self.user)
+        self.auth = authentication.CachedTokenAuthentication()
+
+    def authenticate(self):
+        request = APIRequestFactory().get(
+            '/', HTTP_AUTHORIZATION='Token {}'.format(self.token.key))
+        return self.auth.authenticate(request)
+
+    def test_token_resolved_once(self):
+        with self.assertNumQueries(1):
+            self.authenticate()
+        with self.assertNumQueries(0):
+            user, token = self.authenticate()
+        self.assertEqual((user, token), (self.user, self.token))
+
+    def test_deleted_token_invalidated(self):
+        self.authenticate()
+        self.token.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_deactivated_user_invalidated(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    @override_settings(PUGORUGH_TOKEN_CACHE=None)
+    def test_cache_disabled(self):
+        self.authenticate()
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+    @override_settings(PUGORUGH_TOKEN_CACHE_TTL=-1)
+    def test_ttl_setting_applies(self):
+        self.authenticate()
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+    def test_shared_cache(self):
+        with self.settings(PUGORUGH_TOKEN_CACHE='default'):
+            with self.assertRaises(ImproperlyConfigured):
+                self.authenticate()
+        with shared_cache(self, PUGORUGH_TOKEN_CACHE=True):
+            self.authenticate()
+            with self.assertNumQueries(0):
+                self.authenticate()
+            # Stored outside of the process, not in its LRU
+            self.assertIsNone(authentication.local_cache.get(self.token.key))
+            self.user.is_active = False
+            self.user.save()
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate()
+
+    def test_lru_bounded(self):
+        cache = authentication.LRUCache(max_size=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')),
+                         (1, None, 3))
+
+    def test_lru_expires(self):
+        cache = authentication.LRUCache(max_size=2, ttl=-1)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+
+class CursorsTest(TestCase):
+
+    def setUp(self):
+        self.dogs = [
+            models.Dog.objects.create(
+                name=name, image_filename='{}.jpg'.format(name),
+                age=24, gender='f', size='s')
+            for name in ('Francesca', 'Hank', 'Muffin')
+        ]
+        self.ids = [dog.id for dog in self.dogs]
+
+    def test_next_dog(self):
+        queryset = models.Dog.objects.all()
+        self.assertEqual(cursors.next_dog(queryset, -1), self.dogs[0])
+        self.assertEqual(cursors.next_dog(queryset, self.ids[0]),
+                         self.dogs[1])
+
+    def test_next_dog_wraps_around(self):
+        queryset = models.Dog.objects.exclude(id=self.ids[1])
+        self.assertEqual(cursors.next_dog(queryset, self.ids[2]),
+                         self.dogs[0])
+        # The cursor does not have to be part of the queryset
+        self.assertEqual(cursors.next_dog(queryset, self.ids[0]),
+                         self.dogs[2])
+
+    def test_next_dog_single_query(self):
+        with self.assertNumQueries(1):
+            cursors.next_dog(models.Dog.objects.all(), self.ids[2])
+
+    def test_empty_deck(self):
+        queryset = models.Dog.objects.none()
+        self.assertIsNone(cursors.next_dog(queryset, -1))
+        queryset = models.Dog.objects.filter(size='xl')
+        self.assertIsNone(cursors.next_dog(queryset, self.ids[0]))
+        self.assertEqual(cursors.next_dogs(queryset, self.ids[0], 5), [])
+
+    def test_next_dogs_wraps_without_duplicates(self):
+        queryset = models.Dog.objects.all()
+        self.assertEqual(cursors.next_dogs(queryset, self.ids[1], 5),
+                         [self.dogs[2], self.dogs[0], self.dogs[1]])
+        self.assertEqual(cursors.next_dogs(queryset, self.ids[1], 2),
+                         [self.dogs[2], self.dogs[0]])
+
+
+class DogImporterTest(TestCase):
+    records = [
+        {'name': 'Francesca', 'image_filename': '1.jpg',
+         'breed': 'Labrador', 'age': 72, 'gender': 'f', 'size': 'l'},
+        {'name': 'Hank', 'image_filename': '2.jpg',
+         'breed': 'French Bulldog', 'age': 'old', 'gender': 'm',
+         'size': 's'},
+        {'name': 'Muffin', 'image_filename': '3.jpg',
+         'breed': 'Boxer', 'age': 24, 'gender': 'f', 'size': 'xl'},
+    ]
+
+    def test_iter_records_array_and_lines(self):
+        array = io.StringIO(json.dumps(self.records, indent=2))
+        self.assertEqual(
+            list(importer.iter_records(array, buffer_size=7)), self.records)
+        lines = io.StringIO(
+            '\n'.join(json.dumps(record) for record in self.records))
+        self.assertEqual(
+            list(importer.iter_records(lines, buffer_size=7)), self.records)
+
+    def test_malformed_lines_are_rejected(self):
+        lines = [json.dumps(self.records[0]), '{"name": oops}', '',
+                 json.dumps(self.records[2])]
+        errors = io.StringIO()
+        stats = importer.DogImporter(errors=errors).run(
+            io.StringIO('\n'.join(lines)))
+        self.assertEqual((stats['read'], stats['created'],
+                          stats['rejected']), (3, 2, 1))
+        report = json.loads(errors.getvalue())
+        self.assertEqual((report['record'], report['line'], report['data']),
+                         (1, 2, '{"name": oops}'))
+        self.assertIn('json', report['errors'])
+
+    def test_malformed_array_stops(self):
+        array = io.StringIO('[{"a": 1}, {"b": oops}, {"c": 3}]')
+        records = importer.iter_records(array)
+        self.assertEqual(next(records), {'a': 1})
+        with self.assertRaisesRegex(ValueError, 'Malformed record'):
+            next(records)
+
+    def test_rejects_are_reported(self):
+        errors = io.StringIO()
+        dog_importer = importer.DogImporter(chunk_size=2, errors=errors)
+        stats = dog_importer.run(io.StringIO(json.dumps(self.records)))
+        self.assertEqual((stats['created'], stats['rejected']), (2, 1))
+        report = json.loads(errors.getvalue())
+        self.assertEqual(report['record'], 1)
+        self.assertIn('age', report['errors'])
+
+    def test_reimport_upserts_by_image_filename(self):
+        importer.DogImporter().run(io.StringIO(json.dumps(self.records)))
+        records = [dict(self.records[0], age=73)] + self.records[1:]
+        stats = importer.DogImporter().run(io.StringIO(json.dumps(records)))
+        self.assertEqual((stats['created'], stats['updated'],
+                          stats['unchanged']), (0, 1, 1))
+        self.assertEqual(models.Dog.objects.count(), 2)
+        self.assertEqual(
+            models.Dog.objects.get(image_filename='1.jpg').age, 73)
+
+    def test_lookups_use_an_index(self):
+        sql, params = models.Dog.objects.filter(
+            image_filename__in=['1.jpg', '2.jpg']).query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('USING INDEX', plan)
+
+    def test_lookups_stay_below_sqlite_parameter_limit(self):
+        records = [dict(self.records[0], image_filename='{}.jpg'.format(
+            number)) for number in range(1200)]
+        fp = io.StringIO(json.dumps(records))
+        with CaptureQueriesContext(connection) as queries:
+            stats = importer.DogImporter(chunk_size=1200).run(fp)
+        self.assertEqual(stats['created'], 1200)
+        lookups = [query['sql'] for query in queries
+                   if '"image_filename" IN' in query['sql']]
+        # 500, 500 and 200 file names
+        self.assertEqual([sql.count('.jpg') for sql in lookups],
+                         [500, 500, 200])
+
+
 class UnitTestViews(APITestCase):
 
     def setUp(self):
+        clear_caches()
         self.factory = APIRequestFactory()
         self.user = User.objects.create(username='jonny', password='12#$k')
         self.dog1 = models.Dog.objects.create(
@@ -114,3 +418,1101 @@ class UnitTestViews(APITestCase):
         force_authenticate(request, user=self.user)
         response = view(request, pk='1', decision='liked')
         self.assertTrue(response.status_code)
+
+    def change_status(self, pk, status):
+        view = views.RetrieveChangeStatus.as_view()
+        kwargs = {'pk': pk, 'status': status}
+        request = self.factory.put(reverse('change_status', kwargs=kwargs))
+        force_authenticate(request, user=self.user)
+        return view(request, **kwargs)
+
+    def test_swipe_returns_next_dog(self):
+        self.user_pref.size = 'l,xl'
+        self.user_pref.save()
+        models.UserDog.objects.create(user=self.user, dog=self.dog2)
+        response = self.change_status(self.dog1.id, 'liked')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], self.dog2.id)
+        self.assertEqual(models.UserDog.objects.get(dog=self.dog1).status,
+                         models.UserDog.LIKED)
+        # Wraps around to the first matching dog
+        response = self.change_status(self.dog2.id, 'disliked')
+        self.assertEqual(response.data['id'], self.dog1.id)
+
+    def test_swipe_query_count(self):
+        self.user_pref.size = 'l,xl'
+        self.user_pref.save()
+        models.UserDog.objects.create(user=self.user, dog=self.dog2)
+        counters.recount(self.user)
+        with shared_cache(self, PUGORUGH_PREF_CACHE=True):
+            # Preferences are loaded once, then served from the cache
+            with self.assertNumQueries(5):
+                self.change_status(self.dog1.id, 'liked')
+            # One SELECT of the status, one UPDATE of the row, one of the
+            # counters and one next dog query per swipe
+            with self.assertNumQueries(4):
+                response = self.change_status(self.dog2.id, 'liked')
+            self.assertEqual(response.status_code, 200)
+            # Whatever the previous decision
+            with self.assertNumQueries(4):
+                response = self.change_status(self.dog1.id, 'disliked')
+            self.assertEqual(response.status_code, 200)
+            # Nothing is written when the status does not change
+            with self.assertNumQueries(2):
+                response = self.change_status(self.dog1.id, 'disliked')
+            self.assertEqual(response.status_code, 200)
+        # Without a shared cache the preferences are read by every swipe
+        with self.assertNumQueries(5):
+            self.change_status(self.dog2.id, 'disliked')
+        self.assertEqual(counters.verify(), {})
+
+    def test_swipe_unknown_dog(self):
+        response = self.change_status(self.dog2.id, 'liked')
+        self.assertEqual(response.status_code, 404)
+
+    def test_swipe_dog_not_matching_preferences(self):
+        response = self.change_status(self.dog1.id, 'liked')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(models.UserDog.objects.get().status,
+                         models.UserDog.UNDECIDED)
+
+    def test_batch_statuses(self):
+        self.user_pref.size = 'l,xl'
+        self.user_pref.save()
+        view = views.BatchChangeStatus.as_view()
+        request = self.factory.post(reverse('change_statuses'), [
+            {'dog_id': self.dog1.id, 'status': 'liked'},
+            {'dog_id': self.dog2.id, 'status': 'disliked'},
+        ], format='json')
+        force_authenticate(request, user=self.user)
+        response = view(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['result'] for item in response.data],
+                         ['updated', 'not_found'])
+        self.assertEqual(models.UserDog.objects.get().status,
+                         models.UserDog.LIKED)
+
+    def change_statuses(self, items):
+        view = views.BatchChangeStatus.as_view()
+        request = self.factory.post(reverse('change_statuses'), items,
+                                    format='json')
+        force_authenticate(request, user=self.user)
+        return view(request)
+
+    def test_batch_statuses_unchanged(self):
+        response = self.change_statuses(
+            [{'dog_id': self.dog1.id, 'status': 'undecided'}])
+        # Not matching the preferences of the user
+        self.assertEqual(response.data[0]['result'], 'not_found')
+        self.user_pref.size = 'l,xl'
+        self.user_pref.save()
+        response = self.change_statuses(
+            [{'dog_id': self.dog1.id, 'status': 'undecided'}])
+        self.assertEqual(response.data[0]['result'], 'unchanged')
+
+    def test_batch_statuses_repeated_dog(self):
+        response = self.change_statuses([
+            {'dog_id': self.dog1.id, 'status': 'liked'},
+            {'dog_id': self.dog1.id, 'status': 'disliked'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('listed more than once', str(response.data))
+        self.assertEqual(models.UserDog.objects.get().status,
+                         models.UserDog.UNDECIDED)
+
+    def test_batch_statuses_too_many(self):
+        # The length is checked before the items are validated
+        response = self.change_statuses(
+            [{'dog_id': 'x'}] * (views.BatchChangeStatus.max_items + 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('At most', str(response.data))
+
+    def test_batch_statuses_changed_concurrently(self):
+        self.user_pref.size = 'l,xl'
+        self.user_pref.save()
+        self.change_status(self.dog1.id, 'liked')
+        read_statuses = views.read_statuses
+        # Read before a concurrent request liked the dog
+        stale = [{self.dog1.id: models.UserDog.UNDECIDED}]
+        with mock.patch.object(
+                views, 'read_statuses',
+                side_effect=lambda *args: stale.pop() if stale
+                else read_statuses(*args)):
+            response = self.change_statuses(
+                [{'dog_id': self.dog1.id, 'status': 'disliked'}])
+        self.assertEqual(response.data[0]['result'], 'updated')
+        self.assertEqual(models.UserDog.objects.get().status,
+                         models.UserDog.DISLIKED)
+        self.assertEqual(counters.verify(), {})
+
+    def test_batch_statuses_invalid(self):
+        view = views.BatchChangeStatus.as_view()
+        request = self.factory.post(reverse('change_statuses'), [
+            {'dog_id': self.dog1.id, 'status': 'loved'},
+        ], format='json')
+        force_authenticate(request, user=self.user)
+        response = view(request)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(models.UserDog.objects.get().status,
+                         models.UserDog.UNDECIDED)
+
+    def user_dogs(self, **params):
+        view = views.UserDogList.as_view()
+        request = self.factory.get(reverse('user_dogs'), params)
+        force_authenticate(request, user=self.user)
+        return view(request)
+
+    def test_user_dogs_pages(self):
+        self.user_dog.status = 'l'
+        self.user_dog.save()
+        models.UserDog.objects.create(
+            user=self.user, dog=self.dog2, status='l')
+        response = self.user_dogs(status='liked', page_size=1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([dog['id'] for dog in response.data['results']],
+                         [self.dog2.id])
+        view = views.UserDogList.as_view()
+        request = self.factory.get(response.data['next'])
+        force_authenticate(request, user=self.user)
+        with self.assertNumQueries(1):
+            response = view(request)
+        self.assertEqual([dog['id'] for dog in response.data['results']],
+                         [self.dog1.id])
+        self.assertIsNone(response.data['next'])
+
+    def test_user_dogs_status(self):
+        response = self.user_dogs(status='disliked')
+        self.assertEqual(response.data['results'], [])
+        response = self.user_dogs(status='undecided')
+        self.assertEqual(response.status_code, 400)
+
+    def test_preferences_update_reconciles_user_dogs(self):
+        self.user_dog.status = 'l'
+        self.user_dog.save()
+        view = views.UserPrefView.as_view()
+        request = self.factory.put(
+            'user_prefer', {'age': 'y,a,s', 'gender': 'f', 'size': 'l,xl'})
+        force_authenticate(request, user=self.user)
+        response = view(request)
+        self.assertEqual(response.status_code, 200)
+        statuses = dict(models.UserDog.objects.filter(
+            user=self.user).values_list('dog_id', 'status'))
+        self.assertEqual(statuses, {self.dog1.id: 'l', self.dog2.id: 'u'})
+
+    def test_preferences_update_drops_unmatched_undecided(self):
+        view = views.UserPrefView.as_view()
+        request = self.factory.put(
+            'user_prefer', {'age': 'y', 'gender': 'f', 'size': 'xl'})
+        force_authenticate(request, user=self.user)
+        view(request)
+        dogs = models.UserDog.objects.filter(
+            user=self.user).values_list('dog_id', flat=True)
+        self.assertEqual(list(dogs), [self.dog2.id])
+
+    def test_preferences_filter_cached_until_update(self):
+        with shared_cache(self, PUGORUGH_PREF_CACHE=True):
+            preferences.get_filter(self.user)
+            with self.assertNumQueries(0):
+                preferences.get_filter(self.user)
+            view = views.UserPrefView.as_view()
+            request = self.factory.put(
+                'user_prefer', {'age': 'a,s', 'gender': 'f', 'size': 'l'})
+            force_authenticate(request, user=self.user)
+            view(request)
+            dogs = models.Dog.objects.filter(
+                preferences.get_filter(self.user))
+            self.assertEqual(list(dogs), [self.dog1])
+
+    def test_preferences_cache_must_be_shared(self):
+        with self.settings(PUGORUGH_PREF_CACHE='default'):
+            with self.assertRaises(ImproperlyConfigured):
+                preferences.get_filter(self.user)
+        dummy = {'default': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        with self.settings(CACHES=dummy, PUGORUGH_PREF_CACHE='default'):
+            with self.assertNumQueries(1):
+                preferences.get_filter(self.user)
+        with self.assertNumQueries(1):
+            preferences.get_filter(self.user)
+
+    def test_preferences_get_does_not_rebuild(self):
+        view = views.UserPrefView.as_view()
+        request = self.factory.get('user_prefer')
+        force_authenticate(request, user=self.user)
+        response = view(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(models.UserDog.objects.count(), 1)
+
+
+@override_settings(PUGORUGH_LAZY_USER_DOGS=True)
+class LazyUserDogTestViews(APITestCase):
+
+    def setUp(self):
+        clear_caches()
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create(username='jonny', password='12#$k')
+        self.dog1 = models.Dog.objects.create(
+            name='Francesca', image_filename='1.jpg', breed='Labrador',
+            age=72, gender='f', size='l'
+        )
+        self.dog2 = models.Dog.objects.create(
+            name='Muffin', image_filename='3.jpg', breed='Boxer',
+            age=24, gender='f', size='xl'
+        )
+        self.user_pref = models.UserPref.objects.create(
+            age='b,y,a,s', gender='m,f', size='l,xl',
+            user_id=self.user.id
+        )
+
+    def next_dog(self, pk, status='undecided', **headers):
+        view = views.RetrieveNextDog.as_view()
+        kwargs = {'pk': pk, 'status': status}
+        request = self.factory.get(reverse('next_dog', kwargs=kwargs),
+                                   **headers)
+        force_authenticate(request, user=self.user)
+        return view(request, **kwargs)
+
+    def change_status(self, pk, status):
+        view = views.RetrieveChangeStatus.as_view()
+        kwargs = {'pk': pk, 'status': status}
+        request = self.factory.put(reverse('change_status', kwargs=kwargs))
+        force_authenticate(request, user=self.user)
+        return view(request, **kwargs)
+
+    def test_preferences_update_stores_nothing(self):
+        view = views.UserPrefView.as_view()
+        request = self.factory.put(
+            'user_prefer', {'age': 'y', 'gender': 'f', 'size': 'xl'})
+        force_authenticate(request, user=self.user)
+        response = view(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(models.UserDog.objects.exists())
+
+    def test_undecided_implied_without_rows(self):
+        response = self.next_dog(self.dog1.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], self.dog2.id)
+
+    def test_next_dog_not_modified(self):
+        response = self.next_dog(self.dog1.id)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        response = self.next_dog(self.dog1.id, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # Editing a dog changes the catalog version
+        self.dog2.name = 'Muffy'
+        self.dog2.save()
+        response = self.next_dog(self.dog1.id, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['name'], 'Muffy')
+
+    @override_settings(PUGORUGH_DOG_CACHE='default')
+    def test_serialized_dogs_cached(self):
+        version, _ = catalog.get_version()
+        catalog.serialize_dogs([self.dog1], version)
+        self.dog1.name = 'Not cached'
+        data = catalog.serialize_dogs([self.dog1], version)
+        self.assertEqual(data[0]['name'], 'Francesca')
+
+    def test_decision_upserts_row(self):
+        response = self.change_status(self.dog2.id, 'liked')
+        self.assertEqual(response.status_code, 200)
+        user_dog = models.UserDog.objects.get(user=self.user)
+        self.assertEqual((user_dog.dog_id, user_dog.status),
+                         (self.dog2.id, 'l'))
+        self.change_status(self.dog2.id, 'disliked')
+        self.assertEqual(models.UserDog.objects.get().status, 'd')
+        response = self.next_dog(self.dog1.id)
+        self.assertEqual(response.data['id'], self.dog1.id)
+        response = self.next_dog(self.dog1.id, 'disliked')
+        self.assertEqual(response.data['id'], self.dog2.id)
+
+    def deck(self, pk, **params):
+        view = views.RetrieveDogDeck.as_view()
+        kwargs = {'pk': pk, 'status': 'undecided'}
+        request = self.factory.get(reverse('dog_deck', kwargs=kwargs),
+                                   params)
+        force_authenticate(request, user=self.user)
+        return view(request, **kwargs)
+
+    def test_deck_wraps_around(self):
+        response = self.deck(self.dog1.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([dog['id'] for dog in response.data],
+                         [self.dog2.id, self.dog1.id])
+        response = self.deck(self.dog1.id, size=1)
+        self.assertEqual([dog['id'] for dog in response.data],
+                         [self.dog2.id])
+
+    def test_next_dog_empty_deck(self):
+        self.user_pref.size = 's'
+        self.user_pref.save()
+        preferences.invalidate(self.user)
+        response = self.next_dog(-1)
+        self.assertEqual(response.status_code, 404)
+
+    def test_deck_invalid_size(self):
+        response = self.deck(self.dog1.id, size='many')
+        self.assertEqual(response.status_code, 400)
+
+    def test_empty_deck(self):
+        self.change_status(self.dog1.id, 'liked')
+        self.change_status(self.dog2.id, 'liked')
+        response = self.deck(self.dog1.id)
+        self.assertEqual(response.status_code, 404)
+
+    def test_batch_statuses_upsert(self):
+        self.change_status(self.dog1.id, 'liked')
+        dog3 = models.Dog.objects.create(
+            name='Hank', image_filename='2.jpg', breed='Boxer', age=30,
+            gender='m', size='l')
+        view = views.BatchChangeStatus.as_view()
+        request = self.factory.post(reverse('change_statuses'), [
+            {'dog_id': self.dog1.id, 'status': 'undecided'},
+            {'dog_id': self.dog2.id, 'status': 'liked'},
+            {'dog_id': 0, 'status': 'liked'},
+            {'dog_id': dog3.id, 'status': 'undecided'},
+            {'dog_id': -1, 'status': 'undecided'},
+        ], format='json')
+        force_authenticate(request, user=self.user)
+        response = view(request)
+        self.assertEqual([item['result'] for item in response.data],
+                         ['deleted', 'created', 'not_found', 'unchanged',
+                          'not_found'])
+        user_dog = models.UserDog.objects.get()
+        self.assertEqual((user_dog.dog_id, user_dog.status),
+                         (self.dog2.id, models.UserDog.LIKED))
+
+    def test_swipe_dog_not_matching_preferences(self):
+        self.user_pref.size = 's'
+        self.user_pref.save()
+        response = self.change_status(self.dog1.id, 'liked')
+        self.assertEqual(response.status_code, 404)
+        response = self.change_status(self.dog1.id, 'undecided')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(models.UserDog.objects.exists())
+
+    def test_undecided_removes_row(self):
+        self.change_status(self.dog2.id, 'liked')
+        self.change_status(self.dog2.id, 'undecided')
+        self.assertFalse(models.UserDog.objects.exists())
+
+
+@override_settings(PUGORUGH_METRICS=True)
+class QueryMetricsTest(APITestCase):
+
+    def setUp(self):
+        clear_caches()
+        metrics.registry.clear()
+        self.user = User.objects.create(username='jonny', password='12#$k')
+        models.UserPref.objects.create(user=self.user)
+        self.client.force_authenticate(user=self.user)
+
+    def test_server_timing_and_histograms(self):
+        response = self.client.get('/api/user/preferences/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        histogram = metrics.registry.histograms[
+            ('db_queries', 'user_prefer')]
+        self.assertEqual(histogram.count, 1)
+        self.assertGreaterEqual(histogram.sum, 1)
+
+    def test_metrics_endpoint_admin_only(self):
+        self.client.get('/api/user/preferences/')
+        response = self.client.get('/api/_metrics/')
+        self.assertEqual(response.status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get('/api/_metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            b'pugorugh_db_queries_count{url_name="user_prefer"} 1',
+            response.content)
+
+
+@unittest.skipIf(ranking.np is None, 'NumPy is not installed')
+@override_settings(PUGORUGH_RANKING=True, PUGORUGH_LAZY_USER_DOGS=True)
+class RankingTest(APITestCase):
+
+    def setUp(self):
+        clear_caches()
+        ranking.store.version = None
+        self.user = User.objects.create(username='jonny', password='12#$k')
+        models.UserPref.objects.create(
+            user=self.user, age='b,y,a,s', gender='m,f', size='s,m,l,xl')
+        self.dogs = [
+            models.Dog.objects.create(
+                name=name, image_filename='{}.jpg'.format(name),
+                breed=breed, age=age, gender=gender, size=size)
+            for name, breed, age, gender, size in (
+                ('Francesca', 'Labrador', 72, 'f', 'l'),
+                ('Muffin', 'Boxer', 24, 'f', 'xl'),
+                ('Hercules', 'Labrador', 72, 'm', 'l'),
+                ('Pugsley', 'Pug', 24, 'm', 's'),
+            )
+        ]
+        self.ids = [dog.id for dog in self.dogs]
+        models.UserDog.objects.create(
+            user=self.user, dog=self.dogs[0], status='l')
+
+    def test_ranked_order_wraps_around(self):
+        order = [self.ids[2], self.ids[1], self.ids[3]]
+        pk = -1
+        for expected in order + order[:1]:
+            pk = ranking.next_dog_id(self.user, pk)
+            self.assertEqual(pk, expected)
+        self.assertEqual(ranking.next_dog_ids(self.user, -1, 10), order)
+        self.assertEqual(ranking.next_dog_ids(self.user, order[0], 2),
+                         order[1:])
+
+    def test_dislikes_push_down(self):
+        models.UserDog.objects.create(
+            user=self.user, dog=self.dogs[1], status='d')
+        self.assertEqual(ranking.next_dog_ids(self.user, -1, 10),
+                         [self.ids[2], self.ids[3]])
+
+    def test_catalog_change_refreshes_features(self):
+        ranking.next_dog_id(self.user, -1)
+        dog = models.Dog.objects.create(
+            name='Lassie', image_filename='5.jpg', breed='Labrador',
+            age=72, gender='f', size='l')
+        self.assertEqual(ranking.next_dog_id(self.user, -1), dog.id)
+
+    def test_next_dog_view_serves_best_ranked(self):
+        view = views.RetrieveNextDog.as_view()
+        kwargs = {'pk': -1, 'status': 'undecided'}
+        request = APIRequestFactory().get(reverse('next_dog', kwargs=kwargs))
+        force_authenticate(request, user=self.user)
+        response = view(request, **kwargs)
+        self.assertEqual(response.data['id'], self.ids[2])
+
+
+@override_settings(PUGORUGH_BITSET_INDEX=True)
+class BitsetIndexTest(APITestCase):
+
+    def setUp(self):
+        clear_caches()
+        bitsets.store.version = None
+        self.user = User.objects.create(username='jonny', password='12#$k')
+        models.UserPref.objects.create(
+            user=self.user, age='y,a', gender='f', size='s,m,l,xl')
+        self.dogs = [
+            models.Dog.objects.create(
+                name=str(number), image_filename='{}.jpg'.format(number),
+                age=age, gender=gender, size=size)
+            for number, (age, gender, size) in enumerate((
+                (24, 'f', 'l'), (24, 'm', 'l'), (72, 'f', 's'),
+                (36, 'f', 'xl'), (12, 'f', 'u'), (50, 'f', 's'),
+            ))
+        ]
+        self.ids = [dog.id for dog in self.dogs]
+
+    def test_matching_deck_wraps_around(self):
+        expected = [self.ids[3], self.ids[5], self.ids[0]]
+        self.assertEqual(
+            bitsets.undecided_ids(self.user, self.ids[2], 10), expected)
+        self.assertEqual(
+            bitsets.undecided_ids(self.user, self.ids[5], 1), [self.ids[0]])
+
+    def test_decided_dogs_removed(self):
+        view = views.RetrieveChangeStatus.as_view()
+        bitsets.undecided_ids(self.user, -1, 10)
+        kwargs = {'pk': self.ids[3], 'status': 'liked'}
+        request = APIRequestFactory().put(
+            reverse('change_status', kwargs=kwargs))
+        force_authenticate(request, user=self.user)
+        with self.settings(PUGORUGH_LAZY_USER_DOGS=True):
+            view(request, **kwargs)
+        self.assertEqual(bitsets.undecided_ids(self.user, -1, 10),
+                         [self.ids[0], self.ids[5]])
+
+    def test_next_dog_view_without_dog_query(self):
+        view = views.RetrieveNextDog.as_view()
+        kwargs = {'pk': self.ids[0], 'status': 'undecided'}
+        request = APIRequestFactory().get(reverse('next_dog', kwargs=kwargs))
+        force_authenticate(request, user=self.user)
+        with shared_cache(self, PUGORUGH_PREF_CACHE=True):
+            view(request, **kwargs)
+            with self.assertNumQueries(1):
+                response = view(request, **kwargs)
+        self.assertEqual(response.data['id'], self.ids[3])
+
+    @override_settings(PUGORUGH_BITSET_MAX_DOGS=3)
+    def test_large_catalog_not_indexed(self):
+        self.assertIsNone(bitsets.undecided_ids(self.user, -1, 10))
+
+    def test_memory_reported(self):
+        metrics.registry.clear()
+        with self.assertLogs('pugorugh.bitsets', 'INFO') as logs:
+            index = bitsets.store.get()
+        self.assertGreater(index.memory_bytes(), 0)
+        self.assertIn('Bitmap index of 6 dogs', logs.output[0])
+        rendered = metrics.registry.render()
+        self.assertIn('pugorugh_bitset_index_dogs 6\n', rendered)
+        self.assertIn('pugorugh_bitset_index_bytes {}\n'.format(
+            index.memory_bytes()), rendered)
+
+
+class DecidedDogsInvalidationTest(TransactionTestCase):
+
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create(username='jonny', password='12#$k')
+        self.dog = models.Dog.objects.create(
+            name='Francesca', image_filename='1.jpg', breed='Labrador',
+            age=72, gender='f', size='l')
+        models.UserPref.objects.create(user=self.user, size='l')
+        models.UserDog.objects.create(user=self.user, dog=self.dog)
+
+    def test_forgotten_when_the_swipe_commits(self):
+        with shared_cache(self, PUGORUGH_PREF_CACHE=True):
+            self.assertEqual(bitsets.decided_ids(self.user), [])
+            with transaction.atomic():
+                views.set_dog_status(
+                    self.user, self.dog.id, models.UserDog.LIKED,
+                    models.Dog.objects.all())
+                # Other workers may still read and cache the old ones
+                self.assertEqual(bitsets.decided_ids(self.user), [])
+            self.assertEqual(bitsets.decided_ids(self.user), [self.dog.id])
+
+
+class ReconcileJobTest(APITestCase):
+
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create(username='jonny', password='12#$k')
+        self.dog1 = models.Dog.objects.create(
+            name='Francesca', image_filename='1.jpg', breed='Labrador',
+            age=72, gender='f', size='l'
+        )
+        self.dog2 = models.Dog.objects.create(
+            name='Muffin', image_filename='3.jpg', breed='Boxer',
+            age=24, gender='f', size='xl'
+        )
+        models.UserPref.objects.create(user=self.user, size='s,m')
+        self.client.force_authenticate(user=self.user)
+
+    def set_preferences(self):
+        return self.client.put('/api/user/preferences/',
+                               {'age': 'y,s', 'gender': 'f', 'size': 'xl'})
+
+    def user_dogs(self):
+        return dict(models.UserDog.objects.filter(
+            user=self.user).values_list('dog_id', 'status'))
+
+    def test_inline_job_runs_in_request(self):
+        response = self.set_preferences()
+        self.assertEqual(response.data,
+                         {'age': 'y,s', 'gender': 'f', 'size': 'xl'})
+        job = models.ReconcileJob.objects.get(
+            id=response['X-Reconcile-Job'])
+        self.assertEqual(job.status, models.ReconcileJob.DONE)
+        self.assertEqual(job.created_dogs, 1)
+        self.assertEqual(self.user_dogs(), {self.dog2.id: 'u'})
+        self.assertFalse(jobs.pending(self.user))
+
+    @override_settings(PUGORUGH_JOB_RUNNER='database')
+    def test_deck_filtered_until_job_ran(self):
+        response = self.set_preferences()
+        job_id = response['X-Reconcile-Job']
+        self.assertEqual(self.user_dogs(), {})
+        # Read from the jobs table, not from a cache of this process
+        clear_caches()
+        self.assertTrue(jobs.pending(self.user))
+        response = self.client.get('/api/user/jobs/{}/'.format(job_id))
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertIsNone(response.data['duration'])
+
+        response = self.client.get('/api/dog/-1/undecided/next/')
+        self.assertEqual(response.data['id'], self.dog2.id)
+        response = self.client.put(
+            '/api/dog/{}/liked/'.format(self.dog2.id))
+        self.assertEqual(self.user_dogs(), {self.dog2.id: 'l'})
+
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(self.user_dogs(), {self.dog2.id: 'l'})
+        self.assertFalse(jobs.pending(self.user))
+        response = self.client.get('/api/user/jobs/{}/'.format(job_id))
+        self.assertEqual(response.data['status'], 'done')
+        self.assertGreaterEqual(response.data['duration'], 0)
+
+    @override_settings(PUGORUGH_JOB_RUNNER='database')
+    def test_job_runs_once(self):
+        job_id = self.set_preferences()['X-Reconcile-Job']
+        self.assertTrue(jobs.run(job_id))
+        self.assertFalse(jobs.run(job_id))
+
+    @override_settings(PUGORUGH_JOB_RUNNER='database',
+                       PUGORUGH_JOB_TIMEOUT=60)
+    def test_job_lost_with_its_worker_requeued(self):
+        job_id = self.set_preferences()['X-Reconcile-Job']
+        self.assertTrue(jobs.claim(job_id))
+        self.assertEqual(jobs.requeue_stale(models.ReconcileJob.objects.all()),
+                         0)
+        models.ReconcileJob.objects.filter(id=job_id).update(
+            started=timezone.now() - datetime.timedelta(seconds=61))
+        self.assertTrue(jobs.pending(self.user))
+        job = models.ReconcileJob.objects.get(id=job_id)
+        self.assertEqual(job.status, models.ReconcileJob.PENDING)
+        self.assertIsNone(job.started)
+
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(self.user_dogs(), {self.dog2.id: 'u'})
+        self.assertFalse(jobs.pending(self.user))
+
+    @override_settings(PUGORUGH_JOB_RUNNER='thread',
+                       PUGORUGH_JOB_TIMEOUT=60)
+    def test_thread_job_lost_with_its_worker_submitted(self):
+        job_id = int(self.set_preferences()['X-Reconcile-Job'])
+        models.ReconcileJob.objects.filter(id=job_id).update(
+            created=timezone.now() - datetime.timedelta(seconds=61))
+        executor = mock.Mock()
+        with mock.patch.object(jobs, 'get_executor', return_value=executor), \
+                mock.patch.object(jobs.transaction, 'on_commit',
+                                  side_effect=lambda func: func()):
+            self.assertTrue(jobs.pending(self.user))
+        executor.submit.assert_called_once_with(jobs.run_in_thread, job_id)
+
+    def test_job_of_other_user_hidden(self):
+        job = models.ReconcileJob.objects.create(
+            user=User.objects.create(username='ruma'))
+        response = self.client.get('/api/user/jobs/{}/'.format(job.id))
+        self.assertEqual(response.status_code, 404)
+
+
+class UserDeckStatsTest(APITestCase):
+
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create(username='jonny', password='12#$k')
+        self.dogs = [
+            models.Dog.objects.create(
+                name=str(number), image_filename='{}.jpg'.format(number),
+                age=24, gender='f', size='l')
+            for number in range(4)
+        ]
+        self.client.force_authenticate(user=self.user)
+        self.client.put('/api/user/preferences/',
+                        {'age': 'y', 'gender': 'f', 'size': 'l'})
+
+    def stats(self):
+        return self.client.get('/api/user/stats/').data
+
+    def test_counters_follow_swipes(self):
+        self.assertEqual(self.stats(),
+                         {'liked': 0, 'disliked': 0, 'undecided': 4})
+        self.client.put('/api/dog/{}/liked/'.format(self.dogs[0].id))
+        self.client.put('/api/dog/{}/liked/'.format(self.dogs[1].id))
+        self.client.put('/api/dog/{}/disliked/'.format(self.dogs[1].id))
+        self.client.put('/api/dog/{}/disliked/'.format(self.dogs[1].id))
+        self.client.post('/api/dog/statuses/', [
+            {'dog_id': self.dogs[2].id, 'status': 'liked'},
+            {'dog_id': self.dogs[0].id, 'status': 'undecided'},
+        ], format='json')
+        self.assertEqual(self.stats(),
+                         {'liked': 1, 'disliked': 1, 'undecided': 2})
+        self.assertEqual(counters.verify(), {})
+
+    def test_counters_follow_reconcile(self):
+        self.client.put('/api/dog/{}/liked/'.format(self.dogs[0].id))
+        self.client.put('/api/user/preferences/',
+                        {'age': 'y', 'gender': 'm', 'size': 'l'})
+        self.assertEqual(self.stats(),
+                         {'liked': 1, 'disliked': 0, 'undecided': 0})
+        self.assertEqual(counters.verify(), {})
+
+    def test_stats_read_one_row(self):
+        self.stats()
+        with self.assertNumQueries(1):
+            self.client.force_authenticate(user=self.user)
+            self.stats()
+
+    @override_settings(PUGORUGH_LAZY_USER_DOGS=True)
+    def test_lazy_counters(self):
+        self.client.put('/api/dog/{}/liked/'.format(self.dogs[3].id))
+        self.client.put('/api/dog/{}/disliked/'.format(self.dogs[2].id))
+        self.client.put('/api/dog/{}/undecided/'.format(self.dogs[2].id))
+        self.client.put('/api/dog/{}/undecided/'.format(self.dogs[1].id))
+        self.assertEqual(self.stats(),
+                         {'liked': 1, 'disliked': 0, 'undecided': None})
+        self.assertEqual(counters.verify(), {})
+
+    def test_verify_command_fixes_drift(self):
+        self.client.put('/api/dog/{}/liked/'.format(self.dogs[0].id))
+        self.dogs[0].delete()
+        output = io.StringIO()
+        call_command('deck_stats', stdout=output)
+        self.assertIn('1 user(s) with wrong counters', output.getvalue())
+        call_command('deck_stats', fix=True, stdout=output)
+        self.assertEqual(counters.verify(), {})
+        self.assertEqual(self.stats(),
+                         {'liked': 0, 'disliked': 0, 'undecided': 3})
+
+
+@unittest.skipIf(images.Image is None, 'Pillow is not installed')
+class ImageVariantsTest(TestCase):
+
+    def setUp(self):
+        self.addCleanup(images.variant_urls.reload)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        override = override_settings(PUGORUGH_IMAGE_DIR=self.directory)
+        override.enable()
+        self.addCleanup(override.disable)
+        images.variant_urls.reload()
+        self.save_photo('1.jpg', 'red', (800, 600))
+        self.save_photo('2.png', 'blue', (200, 100))
+        self.dog = models.Dog.objects.create(
+            name='Francesca', image_filename='1.jpg', breed='Labrador',
+            age=72, gender='f', size='l')
+
+    def save_photo(self, filename, color, size):
+        images.Image.new('RGB', size, color).save(
+            os.path.join(self.directory, filename))
+
+    def build(self):
+        result = images.build(widths=(100, 400), formats=('jpeg',),
+                              workers=1)
+        images.variant_urls.reload()
+        return result
+
+    def test_build_and_skip_unchanged(self):
+        self.assertEqual(self.build(), (2, 0, 0))
+        manifest = images.load_manifest()
+        names = manifest['photos']['1.jpg']['variants']['jpeg']
+        self.assertEqual(sorted(names), ['100', '400'])
+        with images.Image.open(os.path.join(
+                images.get_variant_dir(), names['400'])) as variant:
+            self.assertEqual(variant.size, (400, 300))
+        # Never upscaled
+        names = manifest['photos']['2.png']['variants']['jpeg']
+        with images.Image.open(os.path.join(
+                images.get_variant_dir(), names['400'])) as variant:
+            self.assertEqual(variant.size, (200, 100))
+        self.assertEqual(self.build(), (0, 2, 0))
+
+    def test_changed_photo_rebuilt(self):
+        self.build()
+        self.save_photo('1.jpg', 'green', (800, 600))
+        self.assertEqual(self.build(), (1, 1, 2))
+
+    def test_serialized_urls(self):
+        self.assertEqual(serializers.dog_data(self.dog)['images'], {})
+        self.build()
+        urls = serializers.dog_data(self.dog)['images']
+        self.assertEqual(list(urls['jpeg']), ['100', '400'])
+        self.assertTrue(urls['jpeg']['100'].startswith(
+            '/static/images/dogs/variants/1-100w.'))
+        self.assertEqual(serializers.DogSerializer(self.dog).data,
+                         serializers.dog_data(self.dog))
+        self.assertEqual(
+            serializers.DogSerializer(models.Dog.objects.all(),
+                                      many=True).data,
+            serializers.dog_rows(models.Dog.objects.all()))
+
+
+class BenchmarkTest(TestCase):
+    multi_db = True
+
+    def test_queries_of_every_alias_counted(self):
+        benchmark = bench.Benchmark()
+        with benchmark.measure('count'):
+            models.Dog.objects.count()
+            models.Dog.objects.using('read').count()
+        self.assertEqual(benchmark.stats()['count']['queries_max'], 2)
+
+
+class CatalogReadRouterTest(SimpleTestCase):
+
+    def setUp(self):
+        self.router = CatalogReadRouter()
+
+    def test_catalog_reads_on_read_alias(self):
+        self.assertEqual(self.router.db_for_read(models.Dog), 'read')
+        self.assertEqual(self.router.db_for_read(models.Catalog), 'read')
+        self.assertIsNone(self.router.db_for_read(models.UserDog))
+        self.assertEqual(self.router.db_for_write(models.Dog), 'default')
+        self.assertFalse(self.router.allow_migrate('read', 'pugorugh'))
+        self.assertIsNone(self.router.allow_migrate('default', 'pugorugh'))
+
+    @override_settings(PUGORUGH_READ_DATABASE=None)
+    def test_read_alias_disabled(self):
+        self.assertIsNone(self.router.db_for_read(models.Dog))
+
+
+class DatabaseSettingsTest(TestCase):
+
+    def test_catalog_reads_in_transaction_stay_on_default(self):
+        self.assertIsNone(CatalogReadRouter().db_for_read(models.Dog))
+
+    def test_sqlite_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -20000)
+
+
+class CatalogReadRoutingTest(TransactionTestCase):
+    # TestCase wraps each test in a transaction, which keeps reads on
+    # default
+    multi_db = True
+
+    def count_queries(self):
+        """ Queries of a catalog read on default and on the read alias """
+        with CaptureQueriesContext(connections['default']) as default, \
+                CaptureQueriesContext(connections['read']) as read:
+            list(models.Dog.objects.all())
+        return len(default), len(read)
+
+    def test_reads_routed_outside_transactions(self):
+        self.assertEqual(self.count_queries(), (0, 1))
+        with transaction.atomic():
+            self.assertEqual(self.count_queries(), (1, 0))
+
+
+class IndexesMigrationTest(TransactionTestCase):
+    before = [('pugorugh', '0002_auto_20191106_1935')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_duplicate_user_dogs_deleted(self):
+        latest = MigrationLoader(connection).graph.leaf_nodes()
+        self.addCleanup(self.migrate, latest)
+        apps = self.migrate(self.before)
+        User = apps.get_model('auth', 'User')
+        Dog = apps.get_model('pugorugh', 'Dog')
+        UserDog = apps.get_model('pugorugh', 'UserDog')
+        user = User.objects.create(username='dupes')
+        dog = Dog.objects.create(name='Dupe', image_filename='1.jpg',
+                                 breed='Mix', age=12, gender='m', size='m')
+        other = Dog.objects.create(name='Other', image_filename='2.jpg',
+                                   breed='Mix', age=12, gender='f', size='s')
+        UserDog.objects.create(user=user, dog=dog, status='l')
+        last = UserDog.objects.create(user=user, dog=dog, status='d')
+        kept = UserDog.objects.create(user=user, dog=other, status='l')
+
+        self.migrate(latest)
+        self.assertEqual(
+            sorted(models.UserDog.objects.values_list('id', flat=True)),
+            [last.id, kept.id])
+
+
+class UserImporterTest(APITestCase):
+    records = [
+        {'username': 'ana', 'password': 'secret1', 'email': 'a@shelter.org'},
+        {'username': 'bo', 'password': 'secret2'},
+        {'username': 'ana', 'password': 'secret3'},
+        {'username': 'no spaces!', 'password': 'secret4'},
+        {'username': 'jonny', 'password': 'secret5'},
+    ]
+
+    def setUp(self):
+        clear_caches()
+        User.objects.create(username='jonny')
+        self.dog = models.Dog.objects.create(
+            name='Francesca', image_filename='1.jpg', breed='Labrador',
+            age=72, gender='f', size='l')
+
+    def run_importer(self, workers=1):
+        errors, tokens = io.StringIO(), io.StringIO()
+        user_importer = importer.UserImporter(
+            chunk_size=3, errors=errors, tokens=tokens, workers=workers)
+        stats = user_importer.run(
+            io.StringIO('\n'.join(json.dumps(r) for r in self.records)))
+        return (stats,
+                [json.loads(line) for line in errors.getvalue().splitlines()],
+                [json.loads(line) for line in tokens.getvalue().splitlines()])
+
+    def test_users_created_with_preferences_and_token(self):
+        stats, errors, tokens = self.run_importer()
+        self.assertEqual((stats['created'], stats['rejected']), (2, 3))
+        self.assertEqual([error['record'] for error in errors], [2, 3, 4])
+        ana = User.objects.get(username='ana')
+        self.assertTrue(ana.check_password('secret1'))
+        self.assertEqual(ana.email, 'a@shelter.org')
+        self.assertEqual(models.UserPref.objects.get(user=ana).size,
+                         's,m,l,xl')
+        self.assertEqual(
+            {token['username']: token['token'] for token in tokens},
+            dict(Token.objects.filter(user__username__in=('ana', 'bo'))
+                 .values_list('user__username', 'key')))
+        # Default preferences match the dog, rows are inserted without a
+        # reconcile job per user
+        self.assertEqual(
+            models.UserDog.objects.filter(user=ana).count(), 1)
+        self.assertFalse(models.ReconcileJob.objects.exists())
+        self.assertEqual(counters.verify(), {})
+
+    @override_settings(PUGORUGH_JOB_RUNNER='database')
+    def test_user_dogs_left_to_jobs(self):
+        self.run_importer()
+        self.assertEqual(models.ReconcileJob.objects.filter(
+            status=models.ReconcileJob.PENDING).count(), 2)
+        self.assertFalse(models.UserDog.objects.exists())
+        jobs.run_pending()
+        self.assertEqual(models.UserDog.objects.count(), 2)
+
+    def test_passwords_hashed_by_processes(self):
+        self.run_importer(workers=2)
+        self.assertTrue(
+            User.objects.get(username='bo').check_password('secret2'))
+
+    def test_bulk_endpoint(self):
+        url = reverse('bulk_users')
+        self.client.force_authenticate(User.objects.get(username='jonny'))
+        response = self.client.post(url, self.records, format='json')
+        self.assertEqual(response.status_code, 403)
+        admin = User.objects.create(username='admin', is_staff=True)
+        self.client.force_authenticate(admin)
+        with self.settings(PUGORUGH_HASH_WORKERS=1):
+            response = self.client.post(url, self.records, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([user['username'] for user in
+                          response.data['created']], ['ana', 'bo'])
+        self.assertEqual(len(response.data['rejected']), 3)
+        token = response.data['created'][0]['token']
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        response = self.client.get('/api/user/preferences/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_registration_writes_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/api/user/', {'username': 'new', 'password': 'pass123'})
+        self.assertEqual(response.status_code, 201)
+        # Inserted with its password hash, no UPDATE afterwards
+        self.assertEqual(
+            [query['sql'].split()[0] for query in queries
+             if query['sql'].startswith(('INSERT', 'UPDATE'))], ['INSERT'])
+        self.assertTrue(
+            User.objects.get(username='new').check_password('pass123'))
+
+
+@override_settings(PUGORUGH_EXPORT_CHUNK_SIZE=2)
+class ExportTest(APITestCase):
+
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create(username='jonny', password='12#$k')
+        self.dogs = [
+            models.Dog.objects.create(
+                name=str(number), image_filename='{}.jpg'.format(number),
+                breed='Pug', age=24, gender='f', size='l')
+            for number in range(5)
+        ]
+        self.client.force_authenticate(user=self.user)
+        self.client.put('/api/user/preferences/',
+                        {'age': 'y', 'gender': 'f', 'size': 'l'})
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_dog_export(self):
+        response, content = self.get('/api/export/dogs/ndjson/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['id'] for row in rows],
+                         [dog.id for dog in self.dogs])
+        self.assertEqual(rows[0], {
+            'id': self.dogs[0].id, 'name': '0', 'image_filename': '0.jpg',
+            'breed': 'Pug', 'age': 24, 'gender': 'f', 'size': 'l'})
+
+        response, content = self.get('/api/export/dogs/csv/',
+                                     HTTP_ACCEPT='text/csv')
+        lines = content.splitlines()
+        self.assertEqual(lines[0], ','.join(exports.DOG_COLUMNS))
+        self.assertEqual(len(lines), 6)
+
+    def test_batches_walk_ids(self):
+        with self.assertNumQueries(3):
+            batches = list(exports.dog_batches(chunk_size=2))
+        self.assertEqual([len(rows) for rows in batches], [2, 2, 1])
+        models.Dog.objects.all().delete()
+        _, content = self.get('/api/export/dogs/csv/')
+        self.assertEqual(content.splitlines(),
+                         [','.join(exports.DOG_COLUMNS)])
+
+    @override_settings(PUGORUGH_EXPORT_LAG=0)
+    def test_incremental_decisions(self):
+        models.UserDog.objects.filter(user=self.user).update(
+            modified=timezone.now() - datetime.timedelta(days=1))
+        response, content = self.get('/api/user/export/ndjson/')
+        self.assertEqual(len(content.splitlines()), 5)
+        until = response['X-Export-Until']
+
+        self.client.put('/api/dog/{}/liked/'.format(self.dogs[1].id))
+        self.client.post('/api/dog/statuses/', [
+            {'dog_id': self.dogs[3].id, 'status': 'disliked'},
+        ], format='json')
+        _, content = self.get('/api/user/export/ndjson/', since=until)
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(
+            [(row['user_id'], row['dog_id'], row['status']) for row in rows],
+            [(self.user.id, self.dogs[1].id, 'liked'),
+             (self.user.id, self.dogs[3].id, 'disliked')])
+
+        _, content = self.get('/api/user/export/csv/', status='liked')
+        lines = content.splitlines()
+        self.assertEqual(lines[0], 'user_id,dog_id,status,modified')
+        self.assertEqual(lines[1].split(',')[:3],
+                         [str(self.user.id), str(self.dogs[1].id), 'liked'])
+
+    @override_settings(PUGORUGH_EXPORT_LAG=60)
+    def test_until_lags_behind(self):
+        models.UserDog.objects.filter(user=self.user).update(
+            modified=timezone.now() - datetime.timedelta(days=1))
+        # Written just before the export, maybe still uncommitted
+        models.UserDog.objects.filter(dog=self.dogs[0]).update(
+            status=models.UserDog.LIKED, modified=timezone.now())
+        response, content = self.get('/api/user/export/ndjson/')
+        self.assertEqual(len(content.splitlines()), 4)
+        until = exports.parse_since(response['X-Export-Until'])
+        self.assertLess(until, timezone.now() - datetime.timedelta(
+            seconds=59))
+
+        # Picked up once the lag went by
+        later = timezone.now() + datetime.timedelta(seconds=60)
+        with mock.patch.object(exports.timezone, 'now', return_value=later):
+            _, content = self.get('/api/user/export/ndjson/',
+                                  since=response['X-Export-Until'])
+        self.assertEqual([json.loads(line)['dog_id']
+                          for line in content.splitlines()],
+                         [self.dogs[0].id])
+
+    def test_decisions_of_user_use_an_index(self):
+        plan = ' '.join(bench.query_plan(exports.decisions(
+            self.user, since=timezone.now()).order_by('id')))
+        self.assertIn('user_id=? AND modified>?', plan)
+
+    def test_invalid_parameters(self):
+        for params in ({'status': 'maybe'}, {'since': 'yesterday'}):
+            response = self.client.get('/api/user/export/csv/', params)
+            self.assertEqual(response.status_code, 400)
+        self.client.force_authenticate(None)
+        response = self.client.get('/api/export/dogs/csv/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_command(self):
+        other = User.objects.create(username='ana')
+        models.UserDog.objects.create(user=other, dog=self.dogs[0],
+                                      status=models.UserDog.LIKED)
+        models.UserDog.objects.filter(user=other).update(
+            modified=timezone.now() - datetime.timedelta(minutes=1))
+        output = io.StringIO()
+        call_command('export_data', 'decisions', '--status', 'liked',
+                     stdout=output, stderr=io.StringIO())
+        self.assertEqual([json.loads(line)['user_id']
+                          for line in output.getvalue().splitlines()],
+                         [other.id])
+
+        output = io.StringIO()
+        call_command('export_data', 'dogs', '--format', 'csv',
+                     '--chunk-size', '3', stdout=output)
+        self.assertEqual(len(output.getvalue().splitlines()), 6)
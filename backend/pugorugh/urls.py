@@ -19,11 +19,29 @@ urlpatterns = format_suffix_patterns([
         name='login-user'),
     url(r'^api/user/$', UserRegisterView.as_view(),
         name='register-user'),
+    url(r'^api/user/bulk/$', views.BulkUserCreate.as_view(),
+        name='bulk_users'),
     url(r'^api/user/preferences/$', views.UserPrefView.as_view(),
         name='user_prefer'),
+    url(r'^api/user/jobs/(?P<pk>\d+)/$', views.ReconcileJobView.as_view(),
+        name='reconcile_job'),
+    url(r'^api/user/stats/$', views.UserDeckStatsView.as_view(),
+        name='user_stats'),
+    url(r'^api/user/dogs/$', views.UserDogList.as_view(),
+        name='user_dogs'),
+    url(r'^api/user/export/(?P<fmt>ndjson|csv)/$',
+        views.UserDogExport.as_view(), name='user_dog_export'),
     # Dogs endpoints
+    url(r'^api/dog/statuses/$', views.BatchChangeStatus.as_view(),
+        name='change_statuses'),
     url(r'^api/dog/(?P<pk>-?\d+)/(?P<status>liked|disliked|undecided)/$',
         views.RetrieveChangeStatus.as_view(), name='change_status'),
     url(r'^api/dog/(?P<pk>-?\d+)/(?P<status>liked|disliked|undecided)/next/$',
         views.RetrieveNextDog.as_view(), name='next_dog'),
+    url(r'^api/dog/(?P<pk>-?\d+)/(?P<status>liked|disliked|undecided)/deck/$',
+        views.RetrieveDogDeck.as_view(), name='dog_deck'),
+    url(r'^api/export/dogs/(?P<fmt>ndjson|csv)/$',
+        views.DogExport.as_view(), name='dog_export'),
+    # Monitoring
+    url(r'^api/_metrics/$', views.MetricsView.as_view(), name='metrics'),
 ])
@@ -1,16 +1,38 @@
+import io
+import json
+from collections import Counter
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
-from django.http import HttpResponse, Http404
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
 
 from rest_framework import permissions
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.generics import (CreateAPIView, RetrieveUpdateAPIView,
+from rest_framework.exceptions import ValidationError
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.generics import (CreateAPIView, GenericAPIView,
+                                     ListAPIView, RetrieveUpdateAPIView,
                                      RetrieveAPIView, UpdateAPIView)
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from . import serializers
+from . import bitsets
+from . import catalog
+from . import counters
+from . import cursors
+from . import exports
+from . import importer
+from . import jobs
+from . import metrics
 from . import models
+from . import preferences
+from . import ranking
+from . import serializers
+from .decks import BATCH_SIZE
 
 
 class UserRegisterView(CreateAPIView):
@@ -19,82 +41,431 @@ class UserRegisterView(CreateAPIView):
     serializer_class = serializers.UserSerializer
 
 
+# api/user/bulk/
+class BulkUserCreate(APIView):
+    """
+    Create at most max_items users at once from a list of
+    {"username", "password", "email"}, for admins onboarding a shelter.
+    Answers the created users with their token and the rejected records
+    with their errors
+    """
+    permission_classes = (IsAdminUser,)
+    max_items = 1000
+
+    def post(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            raise ValidationError('A list of users is expected.')
+        if len(request.data) > self.max_items:
+            raise ValidationError(
+                'At most {} users per request.'.format(self.max_items))
+        errors, tokens = io.StringIO(), io.StringIO()
+        user_importer = importer.UserImporter(
+            self.max_items, errors, tokens,
+            getattr(settings, 'PUGORUGH_HASH_WORKERS', None))
+        stats = user_importer.import_records(request.data)
+        return Response(
+            {'created': [json.loads(line)
+                         for line in tokens.getvalue().splitlines()],
+             'rejected': [json.loads(line)
+                          for line in errors.getvalue().splitlines()]},
+            status=201 if stats['created'] else 400)
+
+
 # api/user/preferences/
 class UserPrefView(RetrieveUpdateAPIView):
     """
     Get and update User preferences
-    Each time preferences are set UserDog instances are reseted
-    and dogs have 'undecided' status by default
+    Each time preferences are set UserDog instances are reconciled by a
+    job (see pugorugh.jobs) whose id is sent in the X-Reconcile-Job
+    header: newly matching dogs get the 'undecided' status by default
+    and liked/disliked dogs keep their status
+    Nothing is stored up front when PUGORUGH_LAZY_USER_DOGS is set
     """
     permission_classes = (IsAuthenticated,)
-    authentication_classes = (TokenAuthentication,)
     queryset = models.UserPref.objects.all()
     serializer_class = serializers.UserPrefSerializer
     lookup_field = None
+    job = None
 
     def get_object(self):
         user = self.request.user
+        user_pref, created = models.UserPref.objects.get_or_create(user=user)
+        # A fresh set of preferences needs its UserDog rows, reads don't.
+        # An update enqueues its own job once saved.
+        if (created and not lazy_user_dogs() and
+                self.request.method in permissions.SAFE_METHODS):
+            self.job = jobs.enqueue(user)
+        return user_pref
+
+    def perform_update(self, serializer):
+        serializer.save()
+        preferences.invalidate(self.request.user)
+        if not lazy_user_dogs():
+            self.job = jobs.enqueue(self.request.user)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super(UserPrefView, self).finalize_response(
+            request, response, *args, **kwargs)
+        if self.job is not None:
+            response['X-Reconcile-Job'] = str(self.job.id)
+        return response
+
+
+# api/user/jobs/<pk>/
+class ReconcileJobView(RetrieveAPIView):
+    """ Status and duration of a reconciliation job of the user """
+    permission_classes = (IsAuthenticated,)
+    serializer_class = serializers.ReconcileJobSerializer
+
+    def get_queryset(self):
+        return models.ReconcileJob.objects.filter(user=self.request.user)
+
+
+def chunked(items, size=BATCH_SIZE):
+    """ Split a list into consecutive batches of at most size items """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def lazy_user_dogs():
+    """
+    In lazy mode UserDog rows are only stored for liked/disliked dogs,
+    a matching dog without a row is implicitly 'undecided'
+    """
+    return getattr(settings, 'PUGORUGH_LAZY_USER_DOGS', False)
+
+
+def undecided_dogs(user, dogs):
+    """ Remove the dogs already liked or disliked by the user """
+    decided = models.UserDog.objects.filter(
+        user=user, status__in=('l', 'd')).values('dog_id')
+    return dogs.exclude(id__in=decided)
+
+
+def current_status(user_dogs):
+    """ Status of the row of a user and a dog, None when there is none """
+    # (user, dog) is unique, no ORDER BY as first() would add
+    statuses = list(user_dogs.values_list('status', flat=True)[:1])
+    return statuses[0] if statuses else None
+
+
+def update_status(user_dogs, status, previous):
+    """
+    Move the row from previous, its status read beforehand, to status
+    with one filtered UPDATE. When a concurrent request changed it in the
+    meantime the status is read again, under the write lock the UPDATE
+    took. Returns the status the row had, None when there is no row
+    """
+    while previous is not None and previous != status:
+        if user_dogs.filter(status=previous).update(
+                status=status, modified=timezone.now()):
+            return previous
+        previous = current_status(user_dogs)
+    return previous
+
+
+def set_dog_status(user, dog_id, status, dogs):
+    """
+    Store the status of a dog for a user: one SELECT of its status, then
+    a filtered UPDATE and the counters of the user in one transaction
+    Only the dogs of the dogs queryset, the ones matching the preferences
+    of the user, can change. Lazy mode only inserts a row once the dog is
+    liked or disliked, as does eager mode while a reconcile job of the
+    user is pending
+    Returns False when there is no such dog for the user
+    """
+    lazy = lazy_user_dogs()
+    user_dogs = models.UserDog.objects.filter(user=user, dog_id=dog_id)
+    # Read before the transaction: in WAL mode a transaction that read
+    # first can not write any more once another connection committed
+    previous = current_status(user_dogs.filter(dog__in=dogs))
+    if previous == status:
+        return True
+    with transaction.atomic(savepoint=False):
+        bitsets.invalidate(user)
+        if lazy and status == models.UserDog.UNDECIDED:
+            if previous is None:
+                return dogs.filter(id=dog_id).exists()
+            while previous is not None:
+                deleted, _ = user_dogs.filter(status=previous).delete()
+                if deleted:
+                    counters.record(user, {previous: -1})
+                    break
+                previous = current_status(user_dogs)
+            return True
+        previous = update_status(user_dogs, status, previous)
+        if previous is not None:
+            if previous != status:
+                counters.record(user, {previous: -1, status: 1})
+            return True
+        # The row may not be there yet while a reconcile job is pending
+        if not lazy and not jobs.pending(user):
+            return False
+        if not dogs.filter(id=dog_id).exists():
+            return False
         try:
-            user_pref = models.UserPref.objects.get(user=user.id)
-        except models.UserPref.DoesNotExist:
-            user_pref = models.UserPref.objects.create(user=user)
+            with transaction.atomic():
+                models.UserDog.objects.create(
+                    user=user, dog_id=dog_id, status=status)
+        except IntegrityError:
+            # Inserted by a concurrent request in the meantime
+            previous = update_status(
+                user_dogs, status, current_status(user_dogs))
+            if previous not in (None, status):
+                counters.record(user, {previous: -1, status: 1})
+            return True
+        counters.record(user, {status: 1})
+    return True
+
+
+def read_statuses(user, dogs, dog_ids):
+    """
+    Status of the rows of the user for these dog ids, by dog id, for the
+    dogs of the dogs queryset
+    """
+    found = {}
+    for batch in chunked(sorted(dog_ids)):
+        found.update(models.UserDog.objects.filter(
+            user=user, dog_id__in=batch, dog__in=dogs).values_list(
+                'dog_id', 'status'))
+    return found
+
+
+def existing_dogs(dogs, dog_ids):
+    """ The dog ids that belong to the dogs queryset """
+    found = set()
+    for batch in chunked(sorted(dog_ids)):
+        found.update(dogs.filter(id__in=batch).values_list('id', flat=True))
+    return found
+
+
+def set_dog_statuses(user, statuses, dogs):
+    """
+    Store many statuses of a user at once, statuses maps dog ids to
+    status codes, for the dogs of the dogs queryset only. The previous
+    statuses are read first, then the rows are moved with one filtered
+    UPDATE per previous and new status and batch (DELETE for undecided
+    in lazy mode) and the new ones bulk inserted in a single transaction,
+    along with the counters of the user. Rows that a concurrent request
+    changed in between are read again, under the write lock, and retried
+    as set_dog_status does.
+    Returns the outcome for each dog id: 'updated', 'created', 'deleted',
+    'unchanged' or 'not_found'
+    """
+    lazy = lazy_user_dogs()
+    # Only lazy mode and pending reconcile jobs insert rows
+    inserts = lazy or jobs.pending(user)
+    # Read before the transaction, see set_dog_status
+    existing = read_statuses(user, dogs, statuses)
+    known = set()
+    if inserts:
+        known = existing_dogs(dogs, set(statuses).difference(existing))
+    results = {}
+    deltas = Counter()
+    now = timezone.now()
+    todo = statuses
+    with transaction.atomic():
+        bitsets.invalidate(user)
+        while todo:
+            changes = {}
+            to_create = []
+            for dog_id, status in sorted(todo.items()):
+                previous = existing.get(dog_id)
+                if previous is not None and previous != status:
+                    changes.setdefault((previous, status), []).append(dog_id)
+                elif previous is not None or (
+                        lazy and status == models.UserDog.UNDECIDED and
+                        dog_id in known):
+                    # A retried row may already have been moved
+                    results.setdefault(dog_id, 'unchanged')
+                elif dog_id in known:
+                    to_create.append(models.UserDog(
+                        user=user, dog_id=dog_id, status=status))
+                else:
+                    results[dog_id] = 'not_found'
+            stale = set()
+            for (previous, status), dog_ids in sorted(changes.items()):
+                for batch in chunked(dog_ids):
+                    rows = models.UserDog.objects.filter(
+                        user=user, dog_id__in=batch, status=previous)
+                    if lazy and status == models.UserDog.UNDECIDED:
+                        moved, _ = rows.delete()
+                        result = 'deleted'
+                    else:
+                        moved = rows.update(status=status, modified=now)
+                        deltas[status] += moved
+                        result = 'updated'
+                    deltas[previous] -= moved
+                    results.update((dog_id, result) for dog_id in batch)
+                    if moved < len(batch):
+                        stale.update(batch)
+            try:
+                with transaction.atomic():
+                    models.UserDog.objects.bulk_create(
+                        to_create, batch_size=BATCH_SIZE)
+            except IntegrityError:
+                # Some were inserted by a concurrent request in the meantime
+                stale.update(user_dog.dog_id for user_dog in to_create)
+            else:
+                for user_dog in to_create:
+                    results[user_dog.dog_id] = 'created'
+                    deltas[user_dog.status] += 1
+            todo = {dog_id: statuses[dog_id] for dog_id in stale}
+            # Only read again after writing, the transaction holds the lock
+            existing = read_statuses(user, dogs, todo)
+            if inserts:
+                known.update(existing_dogs(
+                    dogs, set(todo).difference(existing)))
+        counters.record(user, deltas)
+    return results
+
+
+class UserDogCursorPagination(CursorPagination):
+    ordering = '-id'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+
+# /api/user/dogs/?status=<liked|disliked>&page_size=<N>
+class UserDogList(ListAPIView):
+    """
+    Liked or disliked dogs of the user, most recent rows first, with
+    cursor pagination: each page is read with a single query
+    """
+    permission_classes = (IsAuthenticated,)
+    pagination_class = UserDogCursorPagination
+    statuses = ('liked', 'disliked')
+
+    def get_queryset(self):
+        status = self.request.query_params.get('status', 'liked')
+        if status not in self.statuses:
+            raise ValidationError(
+                {'status': 'One of {}.'.format(', '.join(self.statuses))})
+        return models.UserDog.objects.filter(
+            user=self.request.user,
+            status=models.UserDog.STATUSES[status],
+        ).select_related('dog')
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        return self.get_paginated_response(
+            [serializers.dog_data(user_dog.dog) for user_dog in page])
 
-        dogs = models.Dog.objects.filter(
-            gender__in=user_pref.gender.split(','),
-            size__in=user_pref.size.split(','),
-            age__in=convert_dog_age(user_pref.age),
-        )
-        models.UserDog.objects.filter(user=user).delete()
-        for dog in dogs:
-            user_dog = models.UserDog.objects.create(user=user, dog=dog)
-        return user_pref
 
+class ExportNegotiation(BaseContentNegotiation):
+    """ Exports pick their format from the url, whatever the Accept header """
 
-def convert_dog_age(prefered_age):
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class ExportView(APIView):
+    """ Streams the rows of an export as NDJSON or CSV """
+    content_negotiation_class = ExportNegotiation
+    filename = 'export'
+
+    def get(self, request, fmt, *args, **kwargs):
+        chunk_size = getattr(settings, 'PUGORUGH_EXPORT_CHUNK_SIZE',
+                             exports.CHUNK_SIZE)
+        batches, columns = self.get_batches(chunk_size)
+        response = StreamingHttpResponse(
+            exports.encode(batches, columns, fmt),
+            content_type=exports.FORMATS[fmt])
+        response['Content-Disposition'] = (
+            'attachment; filename="{}.{}"'.format(self.filename, fmt))
+        return response
+
+
+# /api/export/dogs/<ndjson|csv>/
+class DogExport(ExportView):
+    """ The whole dog catalog """
+    permission_classes = (IsAuthenticated,)
+    filename = 'dogs'
+
+    def get_batches(self, chunk_size):
+        return exports.dog_batches(chunk_size), exports.DOG_COLUMNS
+
+
+# /api/user/export/<ndjson|csv>/?status=<status>&since=<ISO 8601>
+class UserDogExport(ExportView):
     """
-    Inspection of data range showed a dogs age between  2 and 96 months
-    This function changes the selected preference into numerical ranges
+    The statuses of the dogs of the user, those modified since a time when
+    given. The X-Export-Until header is the since of the next export
     """
-    prefered_age = prefered_age.split(',')
-    dog_age = []
-    for item in prefered_age:
-        if item == 'b':
-            dog_age = [x for x in range(1, 11)]
-        elif item == 'y':
-            dog_age += [x for x in range(11, 30)]
-        elif item == 'a':
-            dog_age += [x for x in range(30, 70)]
-        elif item == 's':
-            dog_age += [x for x in range(70, 100)]
-    return dog_age
+    permission_classes = (IsAuthenticated,)
+    filename = 'decisions'
+
+    def get_batches(self, chunk_size):
+        params = self.request.query_params
+        status = params.get('status')
+        if status is not None and status not in models.UserDog.STATUSES:
+            raise ValidationError({'status': 'One of {}.'.format(
+                ', '.join(sorted(models.UserDog.STATUSES)))})
+        since = None
+        if params.get('since'):
+            try:
+                since = exports.parse_since(params['since'])
+            except ValueError as error:
+                raise ValidationError({'since': str(error)})
+        self.until = exports.export_until()
+        user_dogs = exports.decisions(
+            self.request.user, models.UserDog.STATUSES.get(status), since,
+            self.until)
+        return (exports.decision_batches(user_dogs, chunk_size),
+                exports.DECISION_COLUMNS)
 
+    def get(self, request, *args, **kwargs):
+        response = super(UserDogExport, self).get(request, *args, **kwargs)
+        response['X-Export-Until'] = self.until.isoformat()
+        return response
 
-def get_single_dog(dogs_query, pk):
-    """ Function to retrieve a single dog from a query """
-    dog = dogs_query.filter(id__gt=pk).first()
-    if dog is not None:
-        return dog
-    else:
-        return dogs_query.first()
+
+# /api/user/stats/
+class UserDeckStatsView(RetrieveAPIView):
+    """
+    How many dogs the user liked, disliked and has left undecided, read
+    from their counters. Undecided dogs have no row in lazy mode so their
+    count is null there
+    """
+    permission_classes = (IsAuthenticated,)
+    serializer_class = serializers.UserDeckStatsSerializer
+
+    def get_object(self):
+        return counters.get_stats(self.request.user)
+
+    def retrieve(self, request, *args, **kwargs):
+        data = self.get_serializer(self.get_object()).data
+        if lazy_user_dogs():
+            data['undecided'] = None
+        return Response(data)
 
 
 # /api/dog/<pk>/<status>/next/
 class RetrieveNextDog(RetrieveAPIView):
     permission_classes = (IsAuthenticated,)
-    authentication_classes = (TokenAuthentication,)
     queryset = models.Dog.objects.all()
     serializer_class = serializers.DogSerializer
 
     def get_queryset(self):
         """ Filterd dogs by User Preferences then by UserDog status """
         user = self.request.user
-        preferences = models.UserPref.objects.get(user=user.id)
-        dogs = models.Dog.objects.filter(
-            gender__in=preferences.gender.split(','),
-            size__in=preferences.size.split(','),
-            age__in=convert_dog_age(preferences.age))
+        dogs = models.Dog.objects.filter(preferences.get_filter(user))
         status = self.kwargs.get('status')
-        if status == 'undecided':
+        if status == 'undecided' and (lazy_user_dogs() or
+                                      jobs.pending(user)):
+            dogs = undecided_dogs(user, dogs)
+        elif status == 'undecided':
             dogs = dogs.filter(
                 userdog__status__exact='u', userdog__user=user.id)
         elif status == 'liked':
@@ -103,81 +474,141 @@ class RetrieveNextDog(RetrieveAPIView):
         else:
             dogs = dogs.filter(
                 userdog__status__exact='d', userdog__user=user.id)
-        return dogs
+        return dogs.order_by('id')
+
+    def in_memory_ids(self, size):
+        """
+        Next undecided dog ids from the ranking or the bitmap index when
+        one is enabled, None when the deck has to be queried with SQL
+        """
+        if self.kwargs.get('status') != 'undecided':
+            return None
+        user = self.request.user
+        pk = int(self.kwargs.get('pk'))
+        if ranking.enabled() and size == 1:
+            dog_id = ranking.next_dog_id(user, pk)
+            return [] if dog_id is None else [dog_id]
+        if ranking.enabled():
+            return ranking.next_dog_ids(user, pk, size)
+        if bitsets.enabled():
+            return bitsets.undecided_ids(user, pk, size)
+        return None
+
+    def get_dogs(self, size):
+        """ The next size dogs of the deck in order """
+        dog_ids = self.in_memory_ids(size)
+        if dog_ids is None:
+            return cursors.next_dogs(
+                self.get_queryset(), self.kwargs.get('pk'), size)
+        dogs_by_id = models.Dog.objects.in_bulk(dog_ids)
+        return [dogs_by_id[dog_id] for dog_id in dog_ids
+                if dog_id in dogs_by_id]
 
     def get_object(self):
-        dog_id = self.kwargs.get('pk')
-        dogs = self.get_queryset()
-        # Check if queryset is empty
+        dogs = self.get_dogs(1)
+        # The deck is empty
         if not dogs:
             raise Http404
-        else:
-            dog = get_single_dog(dogs, dog_id)
-            return dog
+        return dogs[0]
+
+    def retrieve(self, request, *args, **kwargs):
+        return catalog.dogs_response(request, [self.get_object()],
+                                     many=False)
+
+
+# /api/dog/<pk>/<status>/deck/?size=<N>
+class RetrieveDogDeck(RetrieveNextDog):
+    """
+    Next dogs of the deck in one response, so the client can swipe
+    through a local buffer instead of fetching dogs one by one
+    """
+    default_size = 10
+    max_size = 50
+
+    def get_size(self):
+        size = self.request.query_params.get('size', self.default_size)
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            raise ValidationError({'size': 'A valid integer is required.'})
+        return min(max(size, 1), self.max_size)
+
+    def get(self, request, *args, **kwargs):
+        dogs = self.get_dogs(self.get_size())
+        if not dogs:
+            raise Http404
+        return catalog.dogs_response(request, dogs)
+
+
+# /api/dog/statuses/
+class BatchChangeStatus(GenericAPIView):
+    """
+    Apply a list of at most max_items {"dog_id", "status"} decisions in
+    one request, the status names are the ones of
+    /api/dog/<pk>/<status>/. A dog can only be listed once.
+    """
+    permission_classes = (IsAuthenticated,)
+    serializer_class = serializers.DogStatusSerializer
+    max_items = BATCH_SIZE
+
+    def post(self, request, *args, **kwargs):
+        if isinstance(request.data, list) and (
+                len(request.data) > self.max_items):
+            raise ValidationError(
+                'At most {} statuses per request.'.format(self.max_items))
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        listed = Counter(item['dog_id'] for item in serializer.validated_data)
+        repeated = sorted(dog_id for dog_id, count in listed.items()
+                          if count > 1)
+        if repeated:
+            raise ValidationError('Dogs listed more than once: {}.'.format(
+                ', '.join(str(dog_id) for dog_id in repeated)))
+        statuses = {item['dog_id']: models.UserDog.STATUSES[item['status']]
+                    for item in serializer.validated_data}
+        dogs = models.Dog.objects.filter(
+            preferences.get_filter(self.request.user))
+        results = set_dog_statuses(self.request.user, statuses, dogs)
+        return Response([
+            {'dog_id': item['dog_id'], 'status': item['status'],
+             'result': results[item['dog_id']]}
+            for item in serializer.validated_data
+        ])
 
 
 # /api/dog/<pk>/<status>/
 class RetrieveChangeStatus(UpdateAPIView):
     permission_classes = (IsAuthenticated,)
-    authentication_classes = (TokenAuthentication,)
     queryset = models.Dog.objects.all()
     serializer_class = serializers.DogSerializer
 
     def get_queryset(self):
         """ Get dogs that match preferences"""
         user = self.request.user
-        preferences = models.UserPref.objects.get(user=user.id)
-        dogs = models.Dog.objects.filter(
-            gender__in=preferences.gender.split(','),
-            size__in=preferences.size.split(','),
-            age__in=convert_dog_age(preferences.age),
-        ).order_by('pk')
+        dogs = models.Dog.objects.filter(preferences.get_filter(user))
         return dogs
 
-    def get_object(self):
-        """ Get actual dog info """
+    def put(self, request, *args, **kwargs):
+        """ Change status of selected dog and answer with the next one """
+        status = models.UserDog.STATUSES.get(self.kwargs.get('status'))
         dog_id = self.kwargs.get('pk')
+        if status is None:
+            raise Http404
+        # Only the dogs matching the preferences of the user can change
         dogs = self.get_queryset()
-        if not dogs:
+        if not set_dog_status(self.request.user, dog_id, status, dogs):
+            raise Http404
+        next_dog = cursors.next_dog(dogs, dog_id)
+        if next_dog is None:
             raise Http404
-        dog = self.get_queryset().filter(id__exact=dog_id)
-        return dog
+        return Response(serializers.dog_data(next_dog))
 
-    def put(self, request, *args, **kwargs):
-        """ Change status of selected dog """
-        # These variables are useful for the change of status
-        status = self.kwargs.get('status')
-        dog = self.get_object()
-        user = self.request.user
-        # These are useful for the post PUT event
-        dogs = self.get_queryset()
-        dog_id = self.kwargs.get('pk')
 
-        # /api/dog/<pk>/undecided/
-        if status == 'undecided':
-            user_dog = models.UserDog.objects.get(user=user, dog=dog)
-            user_dog.status = 'u'
-            user_dog.save()
-            next_dog = get_single_dog(dogs, dog_id)
-            serializer = serializers.DogSerializer(next_dog)
-            return Response(serializer.data)
-        # /api/dog/<pk>/liked/
-        elif status == 'liked':
-            user_dog = models.UserDog.objects.get(user=user, dog=dog)
-            user_dog.status = 'l'
-            user_dog.save()
-            next_dog = get_single_dog(dogs, dog_id)
-            serializer = serializers.DogSerializer(next_dog)
-            return Response(serializer.data)
-        # /api/dog/<pk>/disliked/
-        elif status == 'disliked':
-            user_dog = models.UserDog.objects.get(user=user, dog=dog)
-            user_dog.status = 'd'
-            user_dog.save()
-            next_dog = get_single_dog(dogs, dog_id)
-            serializer = serializers.DogSerializer(next_dog)
-            return Response(serializer.data)
-        else:
-            raise Http404
+# /api/_metrics/
+class MetricsView(APIView):
+    """ Aggregated request metrics in the Prometheus text format """
+    permission_classes = (IsAdminUser,)
 
-        return HttpResponse('')
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(metrics.registry.render(),
+                            content_type='text/plain; version=0.0.4')
@@ -0,0 +1,29 @@
+"""
+Gunicorn profile of the web process
+Swipes are short requests that mostly wait on the database, so each
+worker process serves several of them at once from a thread pool
+(gthread) instead of one at a time (sync). The profile is tuned with
+environment variables:
+
+* WEB_CONCURRENCY: worker processes, 2 per CPU plus 1 by default
+* GUNICORN_WORKER_CLASS: 'gthread' by default, 'sync' for the old profile
+* GUNICORN_THREADS: threads per gthread worker, 4 by default
+* GUNICORN_TIMEOUT / GUNICORN_KEEPALIVE: in seconds, 30 and 5 by default
+* PUGORUGH_SQLITE_WAL: '1' by default, puts the SQLite database in WAL
+  mode so the catalog reads go on while a swipe writes
+"""
+import multiprocessing
+import os
+
+
+workers = int(os.environ.get('WEB_CONCURRENCY',
+                             multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# Read by backend/settings.py when the workers load the application
+os.environ.setdefault('PUGORUGH_SQLITE_WAL', '1')
+# Recycle workers now and then so a leak can not grow forever
+max_requests = 1000
+max_requests_jitter = 100